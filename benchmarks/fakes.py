@@ -0,0 +1,164 @@
+"""In-process stand-ins for the Anthropic and GitHub backends.
+
+Both simulate network latency so the benchmark measures the dashboard's own overhead
+on top of realistic upstream timings, without credentials or network access.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+
+
+class FakeStream:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        await asyncio.sleep(self.messages.first_token)
+        for chunk in self.messages.chunks():
+            await asyncio.sleep(self.messages.chunk_delay)
+            yield chunk
+
+
+class FakeMessages:
+    def __init__(self, text: str, first_token: float, chunk_size: int, chunk_delay: float):
+        self.text = text
+        self.first_token = first_token
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    def chunks(self):
+        for start in range(0, len(self.text), self.chunk_size):
+            yield self.text[start:start + self.chunk_size]
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.first_token + self.chunk_delay * len(range(0, len(self.text), self.chunk_size)))
+        return SimpleNamespace(content=[SimpleNamespace(text=self.text)])
+
+    def stream(self, **kwargs):
+        self.calls += 1
+        return FakeStream(self)
+
+
+class FakeAnthropic:
+    """Answers every prompt with ``text``, streamed in ``chunk_size`` character deltas."""
+
+    def __init__(self, text: str, first_token: float = 0.3, chunk_size: int = 40, chunk_delay: float = 0.01):
+        self.messages = FakeMessages(text, first_token, chunk_size, chunk_delay)
+
+
+def git_blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class FakeRequester:
+    """The slice of PyGithub's requester that GitHubIntegration calls directly."""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def requestJson(self, verb, url, parameters=None, headers=None, input=None):
+        self.repo.sleep()
+        status, data = self.repo.route(url[len(self.repo.url):])
+        if status != 200:
+            return status, {}, json.dumps({"message": "Not Found"})
+        etag = '"%s"' % hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        if (headers or {}).get("If-None-Match") == etag:
+            return 304, {"etag": etag}, ""
+        return 200, {"etag": etag}, json.dumps(data)
+
+    def requestJsonAndCheck(self, verb, url, parameters=None, headers=None, input=None):
+        status, response_headers, body = self.requestJson(verb, url, parameters, headers, input)
+        if status >= 400:
+            raise RuntimeError(f"{status} for {url}")
+        return response_headers, json.loads(body)
+
+
+class FakeRepo:
+    """An in-memory repository on one branch, with per-request latency."""
+
+    def __init__(self, files: dict, latency: float = 0.03):
+        self.url = "https://api.github.invalid/repos/bench/repo"
+        self.default_branch = "main"
+        self.latency = latency
+        self.files = {path: content.encode("utf-8") for path, content in files.items()}
+        self.commits = 0
+        self._requester = FakeRequester(self)
+
+    def sleep(self):
+        # PyGithub blocks its thread on the network; so do we
+        time.sleep(self.latency)
+
+    def _entry(self, path: str) -> dict:
+        name = path.rsplit("/", 1)[-1]
+        if path in self.files:
+            return {"name": name, "path": path, "type": "file", "sha": git_blob_sha(self.files[path])}
+        children = sorted(p for p in self.files if p.startswith(path + "/"))
+        sha = hashlib.sha1("\n".join(f"{p}:{git_blob_sha(self.files[p])}" for p in children).encode()).hexdigest()
+        return {"name": name, "path": path, "type": "dir", "sha": sha}
+
+    def _children(self, path: str) -> list:
+        prefix = path + "/" if path else ""
+        names = sorted({p[len(prefix):].split("/", 1)[0] for p in self.files if p.startswith(prefix)})
+        return [self._entry(prefix + name) for name in names]
+
+    def route(self, suffix: str):
+        if suffix.startswith("/contents"):
+            path = suffix[len("/contents"):].lstrip("/")
+            if path in self.files:
+                entry = self._entry(path)
+                entry["content"] = base64.b64encode(self.files[path]).decode()
+                return 200, entry
+            children = self._children(path)
+            return (200, children) if children else (404, None)
+        if suffix.startswith("/git/ref/heads/"):
+            return 200, {"object": {"sha": "%040x" % self.commits}}
+        if suffix.startswith("/git/trees/"):
+            tree = []
+            directories = set()
+            for path in sorted(self.files):
+                parts = path.split("/")
+                for depth in range(1, len(parts)):
+                    directories.add("/".join(parts[:depth]))
+                tree.append({"path": path, "mode": "100644", "type": "blob",
+                             "sha": git_blob_sha(self.files[path]), "size": len(self.files[path])})
+            tree += [{"path": d, "mode": "040000", "type": "tree", "sha": self._entry(d)["sha"]} for d in directories]
+            return 200, {"sha": self._entry("")["sha"], "tree": tree, "truncated": False}
+        return 404, None
+
+    def _write(self, path: str, content: str) -> dict:
+        self.sleep()
+        self.files[path] = content.encode("utf-8")
+        self.commits += 1
+        return {"content": SimpleNamespace(sha=git_blob_sha(self.files[path]))}
+
+    def create_file(self, path, message, content):
+        return self._write(path, content)
+
+    def update_file(self, path, message, content, sha):
+        return self._write(path, content)
+
+    def delete_file(self, path, message, sha):
+        self.sleep()
+        self.files.pop(path, None)
+        self.commits += 1
+
+
+class FakeGithub:
+    def __init__(self, repo: FakeRepo):
+        self.repo = repo
+
+    def get_repo(self, name):
+        self.repo.sleep()
+        return self.repo
@@ -0,0 +1,343 @@
+"""Load and latency benchmark for the dashboard's WebSocket endpoints.
+
+    python benchmarks/ws_bench.py
+    python benchmarks/ws_bench.py --clients 50 --no-baseline
+    python benchmarks/ws_bench.py --save-baseline benchmarks/baseline.json
+
+Serves ``dashboard.app`` with uvicorn inside this process, with fake Anthropic and
+GitHub backends (see fakes.py), and drives simulated clients against it:
+
+- execute: runs the snippets in ``code_examples/`` over /ws/execute
+- llm: asks /ws/llm for streamed code (the fake answers with ``dino_game.py``)
+- github: browses, reads and saves files over /ws/github
+- updates: writes a watched file and waits for /ws/updates to report it
+
+Each client runs one scenario in a closed loop. Results include p50/p95/p99 latency
+and throughput per scenario, plus how late the event loop wakes up under that load.
+Each run is compared against ``--baseline`` (default ``benchmarks/baseline.json``) and
+fails (exit code 1) if any p95 or the loop lag p99 grew, or any throughput shrank, by
+more than ``--tolerance``. The committed baseline comes from a run with the default
+settings (20 clients, 3 s warmup, 20 s measured, the default mix and fake latencies,
+seed 1); its ``config`` records them along with the Python version and CPU count of the
+machine. Numbers only compare on similar hardware, so after changing machines, or
+settings on purpose, re-save the baseline with the default settings and commit it.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websockets
+from fakes import FakeAnthropic, FakeGithub, FakeRepo
+
+SCENARIOS = ("execute", "llm", "github", "updates")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Settings that must match for two runs to be comparable
+SETTINGS = ("clients", "duration", "warmup", "mix", "llm_first_token", "no_llm_cache", "github_latency", "seed")
+PROMPTS = ["a dino run game", "a fibonacci pyramid", "safe division", "a number guessing game"]
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+class Recorder:
+    def __init__(self, warmup_until: float):
+        self.warmup_until = warmup_until
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, name: str, started: float):
+        if started >= self.warmup_until:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    def error(self, name: str, error):
+        self.errors.setdefault(name, []).append(str(error))
+
+
+async def receive_until(ws, done):
+    while True:
+        message = json.loads(await ws.recv())
+        if done(message):
+            return message
+
+
+async def execute_client(url: str, recorder: Recorder, stop: float, snippets: list):
+    async with websockets.connect(f"{url}/ws/execute") as ws:
+        await receive_until(ws, lambda m: m.get("type") == "session_started")
+        while time.perf_counter() < stop:
+            job_id = uuid.uuid4().hex
+            started = time.perf_counter()
+            await ws.send(json.dumps({"code": random.choice(snippets), "job_id": job_id}))
+            result = await receive_until(ws, lambda m: m.get("job_id") == job_id and "status" in m)
+            if result["status"] != "success":
+                recorder.error("execute", result.get("error"))
+            recorder.add("execute", started)
+
+
+async def llm_client(url: str, recorder: Recorder, stop: float):
+    async with websockets.connect(f"{url}/ws/llm") as ws:
+        while time.perf_counter() < stop:
+            request_id = uuid.uuid4().hex
+            started = time.perf_counter()
+            # Half the prompts repeat (cache hits after the first), half are new (upstream calls)
+            prompt = random.choice(PROMPTS)
+            if random.random() < 0.5:
+                prompt = f"{prompt} #{request_id[:8]}"
+            await ws.send(json.dumps({"type": "generate_code", "request_id": request_id,
+                                      "prompt": prompt, "stream": True, "execute": False}))
+            first = True
+            while True:
+                message = json.loads(await ws.recv())
+                if message.get("request_id") != request_id:
+                    continue
+                if message.get("type") == "code_delta" and first:
+                    first = False
+                    recorder.add("llm_first_token", started)
+                elif message.get("type") == "code_generated":
+                    recorder.add("llm", started)
+                    break
+                elif message.get("type") == "error":
+                    recorder.error("llm", message.get("error"))
+                    break
+
+
+async def github_client(url: str, recorder: Recorder, stop: float, paths: list):
+    async with websockets.connect(f"{url}/ws/github") as ws:
+        while time.perf_counter() < stop:
+            roll = random.random()
+            if roll < 0.4:
+                request = {"operation": "list", "path": ""}
+            elif roll < 0.9:
+                request = {"operation": "get", "path": random.choice(paths)}
+            else:
+                request = {"operation": "save", "path": f"bench/{uuid.uuid4().hex[:6]}.py",
+                           "content": "print('saved')\n"}
+            started = time.perf_counter()
+            await ws.send(json.dumps(request))
+            message = json.loads(await ws.recv())
+            if message.get("type") == "error":
+                recorder.error("github", message.get("content"))
+            recorder.add("github", started)
+
+
+async def updates_client(url: str, recorder: Recorder, stop: float, directory: str):
+    async with websockets.connect(f"{url}/ws/updates") as ws:
+        while time.perf_counter() < stop:
+            name = f"bench_{uuid.uuid4().hex[:8]}.py"
+            started = time.perf_counter()
+            await asyncio.to_thread(write_file, os.path.join(directory, name), f"# {name}\n")
+            try:
+                await asyncio.wait_for(receive_until(
+                    ws, lambda m: m.get("type") == "files_changed"
+                    and any(change["path"].endswith(name) for change in m["changes"])), 10)
+            except asyncio.TimeoutError:
+                recorder.error("updates", f"no files_changed for {name}")
+                continue
+            recorder.add("updates", started)
+
+
+def write_file(path: str, content: str):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+async def monitor_loop_lag(stop: float, warmup_until: float, interval: float = 0.01) -> list:
+    """How late each ``interval`` sleep wakes up: a direct measure of event-loop blocking."""
+    lags = []
+    while time.perf_counter() < stop:
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        if before >= warmup_until:
+            lags.append(max(0.0, time.perf_counter() - before - interval))
+    return lags
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def assign(clients: int, mix: dict) -> list:
+    """Split ``clients`` across scenarios in proportion to ``mix``, at least one each."""
+    total = sum(mix.values())
+    counts = {name: max(1, round(clients * weight / total)) for name, weight in mix.items() if weight > 0}
+    return [name for name, count in counts.items() for _ in range(count)]
+
+
+async def run(args) -> dict:
+    import uvicorn
+    import dashboard
+    import github_integration
+    import llm_integration
+
+    with open(os.path.join(ROOT, "dino_game.py")) as f:
+        llm_integration.llm._client = FakeAnthropic(f.read(), first_token=args.llm_first_token)
+    llm_integration.llm.cache.enabled = not args.no_llm_cache
+    examples = os.path.join(ROOT, "code_examples")
+    snippets = {name: open(os.path.join(examples, name)).read() for name in sorted(os.listdir(examples))}
+    github_integration.github.repo_name = "bench/repo"
+    github_integration.github._github = FakeGithub(FakeRepo(
+        {f"code_examples/{name}": code for name, code in snippets.items()}, latency=args.github_latency))
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    url = f"ws://127.0.0.1:{sock.getsockname()[1]}"
+    server = uvicorn.Server(uvicorn.Config(dashboard.app, log_level="warning", lifespan="on"))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    now = time.perf_counter()
+    warmup_until = now + args.warmup
+    stop = warmup_until + args.duration
+    recorder = Recorder(warmup_until)
+    roles = assign(args.clients, parse_mix(args.mix))
+    clients = []
+    for role in roles:
+        if role == "execute":
+            clients.append(execute_client(url, recorder, stop, list(snippets.values())))
+        elif role == "llm":
+            clients.append(llm_client(url, recorder, stop))
+        elif role == "github":
+            clients.append(github_client(url, recorder, stop, [f"code_examples/{name}" for name in snippets]))
+        else:
+            clients.append(updates_client(url, recorder, stop, args.watch_dir))
+    lag_task = asyncio.create_task(monitor_loop_lag(stop, warmup_until))
+    outcomes = await asyncio.gather(*clients, return_exceptions=True)
+    lags = await lag_task
+
+    server.should_exit = True
+    await serving
+
+    for role, outcome in zip(roles, outcomes):
+        if isinstance(outcome, Exception):
+            recorder.error(role, repr(outcome))
+    return {
+        "config": dict({name: getattr(args, name) for name in SETTINGS}, clients=len(roles),
+                       python=platform.python_version(), cpus=os.cpu_count()),
+        "scenarios": {name: dict(summarize(values, args.duration), errors=len(recorder.errors.get(name, [])))
+                      for name, values in sorted(recorder.latencies.items())},
+        "loop_lag": {
+            "p50_ms": round(percentile(lags, 0.50) * 1000, 2) if lags else 0.0,
+            "p99_ms": round(percentile(lags, 0.99) * 1000, 2) if lags else 0.0,
+            "max_ms": round(max(lags) * 1000, 2) if lags else 0.0
+        },
+        "error_samples": {name: errors[:3] for name, errors in recorder.errors.items()}
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or not previous.get("count") or not current.get("count"):
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput']}/s -> {current['throughput']}/s")
+    previous_lag = baseline.get("loop_lag", {}).get("p99_ms")
+    # Loop lag is a few ms when healthy, so allow at least 5 ms of noise
+    if previous_lag is not None and results["loop_lag"]["p99_ms"] > max(previous_lag * (1 + tolerance), previous_lag + 5):
+        regressions.append(f"loop lag p99 {previous_lag} ms -> {results['loop_lag']['p99_ms']} ms")
+    return regressions
+
+
+def report(results: dict):
+    print(f"{'scenario':<16}{'count':>8}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in results["scenarios"].items():
+        print(f"{name:<16}{stats['count']:>8}{stats['throughput']:>9}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}")
+    lag = results["loop_lag"]
+    print(f"\nevent loop lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+    for name, errors in results["error_samples"].items():
+        print(f"{name} errors, e.g.: {errors}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds, after warmup")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--mix", default="execute=4,llm=3,github=2,updates=1")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="fake upstream time to first token")
+    parser.add_argument("--no-llm-cache", action="store_true", help="send every prompt upstream")
+    parser.add_argument("--github-latency", type=float, default=0.03, help="fake GitHub seconds per request")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--baseline", default=BASELINE, help="compare against results saved with --save-baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="skip the comparison")
+    parser.add_argument("--save-baseline", help="write the results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory() as scratch:
+        args.watch_dir = os.path.join(scratch, "watched")
+        os.makedirs(args.watch_dir)
+        # Must be set before dashboard is imported, since the integrations read them then
+        os.environ["LIVE_UPDATES_PATHS"] = args.watch_dir
+        os.environ["LLM_CACHE_PATH"] = os.path.join(scratch, "llm_cache.jsonl")
+        os.environ.setdefault("GITHUB_REPO", "bench/repo")
+        results = asyncio.run(run(args))
+
+    report(results)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+    if args.baseline and not args.no_baseline and not args.save_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; save one with --save-baseline")
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differences = [f"{name}={baseline['config'].get(name)!r} (now {value!r})"
+                       for name, value in results["config"].items() if baseline["config"].get(name) != value]
+        if differences:
+            print(f"\nWarning: the baseline was recorded with different settings: {', '.join(differences)}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
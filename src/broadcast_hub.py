@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+metrics.histogram("broadcast_fanout_seconds", "Time to serialize and queue one broadcast")
+dropped_total = metrics.counter("broadcast_dropped_total", "Frames dropped for slow clients")
+disconnected_total = metrics.counter("broadcast_disconnected_total", "Clients disconnected for being too slow")
+
+
+class ClientChannel:
+    """One subscriber: a bounded queue of serialized frames drained by its own writer task."""
+
+    def __init__(self, hub, client_id: int, websocket, max_queue: int):
+        self.hub = hub
+        self.client_id = client_id
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.sent = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.task = asyncio.create_task(self._write())
+
+    def offer(self, text: str) -> bool:
+        """Queue a frame without waiting; returns False if the client is too far behind."""
+        item = (text, time.monotonic())
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            if self.hub.slow_policy == "disconnect":
+                return False
+            # Drop the oldest frame: a late client would rather see the newest state
+            self.queue.get_nowait()
+            self.queue.put_nowait(item)
+            self.dropped += 1
+            dropped_total.inc()
+            return True
+
+    async def _write(self):
+        try:
+            while True:
+                text, queued_at = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(text), self.hub.send_timeout)
+                self.sent += 1
+                self.last_lag = time.monotonic() - queued_at
+                self.max_lag = max(self.max_lag, self.last_lag)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to websocket {self.client_id}: {e}")
+            self.hub.remove(self.client_id)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "last_lag": round(self.last_lag, 4),
+            "max_lag": round(self.max_lag, 4)
+        }
+
+
+class BroadcastHub:
+    """Fans messages out to many WebSockets without letting one slow client hold up the rest.
+
+    Each message is serialized once. Every client has a queue of at most ``max_queue``
+    frames and a writer task. When a queue is full, ``slow_policy`` decides what happens:
+    "drop" discards that client's oldest frame and "disconnect" closes the client.
+    """
+
+    def __init__(self, max_queue: int = None, slow_policy: str = None, send_timeout: float = None):
+        self.max_queue = max_queue or int(os.getenv("LIVE_UPDATES_QUEUE_SIZE", "64"))
+        self.slow_policy = slow_policy or os.getenv("LIVE_UPDATES_SLOW_POLICY", "drop")
+        if self.slow_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow client policy: {self.slow_policy}")
+        self.send_timeout = send_timeout or float(os.getenv("LIVE_UPDATES_SEND_TIMEOUT", "5"))
+        self.clients = {}
+        self.published = 0
+        self.disconnected = 0
+
+    def add(self, client_id: int, websocket) -> ClientChannel:
+        channel = ClientChannel(self, client_id, websocket, self.max_queue)
+        self.clients[client_id] = channel
+        return channel
+
+    def remove(self, client_id: int, close: bool = False):
+        channel = self.clients.pop(client_id, None)
+        if channel is None:
+            return
+        if channel.task is not asyncio.current_task():
+            channel.task.cancel()
+        if close:
+            self.disconnected += 1
+            disconnected_total.inc()
+            asyncio.create_task(self._close(channel))
+
+    async def _close(self, channel: ClientChannel):
+        try:
+            # 1013: try again later
+            await channel.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def publish(self, data: dict):
+        """Serialize ``data`` once and queue it for every client."""
+        with metrics.time("broadcast_fanout_seconds"):
+            self.published += 1
+            text = json.dumps(data)
+            for client_id, channel in list(self.clients.items()):
+                if not channel.offer(text):
+                    logger.warning(f"Disconnecting slow websocket {client_id}")
+                    self.remove(client_id, close=True)
+
+    def send(self, client_id: int, data: dict):
+        """Queue a message for one client, behind whatever is already queued for it."""
+        channel = self.clients.get(client_id)
+        if channel is not None and not channel.offer(json.dumps(data)):
+            self.remove(client_id, close=True)
+
+    def stats(self) -> dict:
+        clients = {client_id: channel.stats() for client_id, channel in self.clients.items()}
+        return {
+            "clients": len(clients),
+            "published": self.published,
+            "disconnected": self.disconnected,
+            "dropped": sum(client["dropped"] for client in clients.values()),
+            "max_queue_depth": max((client["queue_depth"] for client in clients.values()), default=0),
+            "max_lag": max((client["max_lag"] for client in clients.values()), default=0.0),
+            "per_client": clients
+        }
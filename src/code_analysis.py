@@ -0,0 +1,136 @@
+import ast
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CodePlan:
+    """What a single parse of a snippet tells us about how to run it."""
+
+    def __init__(self, tree: ast.Module = None, syntax_error: SyntaxError = None):
+        self.tree = tree
+        self.syntax_error = syntax_error
+        self.is_expression = False
+        self.needs_input = False
+        self.imports = ()
+        self.required_imports = ()
+        self.unbounded_loop_lines = ()
+
+    @property
+    def has_unbounded_loops(self) -> bool:
+        return bool(self.unbounded_loop_lines)
+
+    @property
+    def interactive(self) -> bool:
+        return self.needs_input or self.has_unbounded_loops
+
+    @property
+    def mode(self) -> str:
+        return 'eval' if self.is_expression else 'exec'
+
+    def compile(self, filename: str = '<string>'):
+        """Compile the already-parsed tree in this plan's mode."""
+        if self.is_expression:
+            expression = ast.Expression(body=self.tree.body[0].value)
+            return compile(expression, filename, 'eval')
+        return compile(self.tree, filename, 'exec')
+
+    def to_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "is_expression": self.is_expression,
+            "needs_input": self.needs_input,
+            "imports": list(self.imports),
+            "required_imports": list(self.required_imports),
+            "has_unbounded_loops": self.has_unbounded_loops,
+            "unbounded_loop_lines": list(self.unbounded_loop_lines)
+        }
+
+
+class _PlanVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.needs_input = False
+        self.imports = set()
+        self.unbounded_loop_lines = []
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.add(alias.name.split('.')[0])
+
+    def visit_ImportFrom(self, node):
+        if node.level == 0 and node.module:
+            self.imports.add(node.module.split('.')[0])
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id == 'input':
+            self.needs_input = True
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        # sys.stdin.read(), sys.stdin.readline(), iterating sys.stdin, ...
+        if node.attr == 'stdin' and isinstance(node.value, ast.Name) and node.value.id == 'sys':
+            self.needs_input = True
+        self.generic_visit(node)
+
+    def visit_While(self, node):
+        if _is_always_true(node.test) and not _breaks_out(node.body):
+            self.unbounded_loop_lines.append(node.lineno)
+        self.generic_visit(node)
+
+
+def _top_level_imports(tree: ast.Module) -> set:
+    """Modules imported by statements that always run: module-level imports outside any
+    try, if or function body. Others may be optional or never reached."""
+    names = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+def _is_always_true(test: ast.expr) -> bool:
+    return isinstance(test, ast.Constant) and bool(test.value)
+
+
+def _breaks_out(body: list) -> bool:
+    """Whether a loop body contains a break or return that can leave that loop."""
+    for node in body:
+        for child in _walk_same_loop(node):
+            if isinstance(child, (ast.Break, ast.Return)):
+                return True
+    return False
+
+
+def _walk_same_loop(node: ast.AST):
+    """Walk ``node`` without descending into nested loops, functions or classes."""
+    if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+        # A return inside a nested loop still leaves the outer loop
+        yield from (n for n in ast.walk(node) if isinstance(n, ast.Return))
+        return
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+        return
+    yield node
+    for child in ast.iter_child_nodes(node):
+        yield from _walk_same_loop(child)
+
+
+def analyze_code(source: str) -> CodePlan:
+    """Parse ``source`` once and describe how it should be executed."""
+    try:
+        tree = ast.parse(source, '<string>', 'exec')
+    except SyntaxError as e:
+        e.__traceback__ = None
+        return CodePlan(syntax_error=e)
+
+    plan = CodePlan(tree)
+    plan.is_expression = len(tree.body) == 1 and isinstance(tree.body[0], ast.Expr)
+    visitor = _PlanVisitor()
+    visitor.visit(tree)
+    plan.needs_input = visitor.needs_input
+    plan.imports = tuple(sorted(visitor.imports))
+    plan.required_imports = tuple(sorted(_top_level_imports(tree)))
+    plan.unbounded_loop_lines = tuple(visitor.unbounded_loop_lines)
+    return plan
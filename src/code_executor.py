@@ -1,58 +1,85 @@
 from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
 import traceback
-from io import StringIO
-import sys
-import contextlib
 import logging
+import os
 import time
 import re
+import importlib.util
+import uuid
+from worker_pool import worker_pool, ExecutionLimits
+from compile_cache import compile_cache, CompiledSnippet
+from output_stream import OutputChannel
+from code_analysis import analyze_code, CodePlan
+from package_installer import package_installer
+from metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+metrics.histogram("executor_stage_seconds", "Time spent in each stage of execute_code")
+executions_total = metrics.counter("executions_total", "Finished executions by outcome")
 
-class InteractiveBuffer:
-    def __init__(self, websocket):
-        self.websocket = websocket
-        self.buffer = StringIO()
-
-    async def write(self, text):
-        self.buffer.write(text)
-        # Send real-time output to the dashboard
-        await self.websocket.send_json({
-            "type": "interactive_output",
-            "content": text
-        })
 
-    def flush(self):
-        self.buffer.flush()
+class ExecutionJob:
+    """An in-flight execution, tracked in CodeExecutor.running_tasks until it finishes."""
 
-    def getvalue(self):
-        return self.buffer.getvalue()
+    def __init__(self, job_id: str, websocket, limits: ExecutionLimits):
+        self.job_id = job_id
+        self.websocket = websocket
+        self.limits = limits
+        self.output = None
+        self.interactive_mode = False
+        self.input_queue = asyncio.Queue()
+        self.awaiting_input = False
+        self.task = None
+        self.cancelled = False
+        self.started_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "interactive": self.interactive_mode,
+            "awaiting_input": self.awaiting_input,
+            "running_for": f"{time.time() - self.started_at:.3f}s",
+            "limits": self.limits.to_dict()
+        }
 
 
 class CodeExecutor:
     def __init__(self):
-        self.output_buffer = StringIO()
-        self.interactive_mode = False
-        self.current_websocket = None
         self.running_tasks = {}
 
-    @contextlib.contextmanager
-    def capture_output(self, websocket=None):
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        if websocket and self.interactive_mode:
-            interactive_buffer = InteractiveBuffer(websocket)
-            sys.stdout = sys.stderr = interactive_buffer
+    def cancel(self, websocket, job_id: str) -> bool:
+        """Cancel an in-flight job started from ``websocket``; its worker process is killed and replaced.
+
+        Jobs are keyed by connection and id, so a client can only reach its own jobs even
+        when two connections pick the same id.
+        """
+        job = self.running_tasks.get((websocket, job_id))
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.cancelled = True
+        job.task.cancel()
+        return True
+
+    def cancel_all(self, websocket):
+        """Cancel every in-flight job started from ``websocket``."""
+        for job in list(self.running_tasks.values()):
+            if job.websocket is websocket:
+                self.cancel(websocket, job.job_id)
+
+    def provide_input(self, websocket, value: str, job_id: str = None) -> bool:
+        """Deliver a line of input to a job waiting on input()."""
+        if job_id:
+            job = self.running_tasks.get((websocket, job_id))
         else:
-            sys.stdout = sys.stderr = self.output_buffer
-        try:
-            yield
-        finally:
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+            job = next((j for j in self.running_tasks.values()
+                        if j.websocket is websocket and j.awaiting_input), None)
+        if job is None or job.websocket is not websocket:
+            return False
+        job.input_queue.put_nowait(value)
+        return True
 
     def extract_python_code(self, content: str) -> str:
         """Extract and clean Python code from various formats."""
@@ -82,143 +109,218 @@ class CodeExecutor:
 
         return '\n'.join(cleaned_lines)
 
-    def wrap_interactive_code(self, code: str) -> str:
-        """Wrap code to handle interactive features within the dashboard."""
-        wrapped_code = f"""
-import asyncio
-from contextlib import contextmanager
+    def compile_snippet(self, content: str) -> CompiledSnippet:
+        """Clean ``content``, analyze it and compile it once, recording a SyntaxError instead of raising."""
+        with metrics.time("executor_stage_seconds", stage="extract"):
+            cleaned_code = self.extract_python_code(content)
+        with metrics.time("executor_stage_seconds", stage="compile"):
+            plan = analyze_code(cleaned_code)
+            if plan.syntax_error is not None:
+                return CompiledSnippet(cleaned_code, plan, syntax_error=plan.syntax_error)
+            try:
+                code = plan.compile()
+            except SyntaxError as e:
+                # e.g. 'return' outside function, which the parser alone accepts
+                e.__traceback__ = None
+                return CompiledSnippet(cleaned_code, plan, syntax_error=e)
+            finally:
+                # The code object is all we need from here on
+                plan.tree = None
+        return CompiledSnippet(cleaned_code, plan, code)
+
+    def find_missing_modules(self, plan: CodePlan) -> list:
+        """Top-level modules imported by the code that cannot be found."""
+        missing = []
+        for name in plan.imports:
+            try:
+                if importlib.util.find_spec(name) is None:
+                    missing.append(name)
+            except (ImportError, ValueError):
+                missing.append(name)
+        return missing
+
+    async def install_missing(self, job: ExecutionJob, plan: CodePlan, missing: list) -> list:
+        """Install the missing modules that the wheelhouse has; returns what is still missing."""
+        installable = [name for name in missing if package_installer.available(name)]
+        if not installable:
+            return missing
+        results = await asyncio.gather(*(install_package(job.websocket, name, job.job_id) for name in installable))
+        if not any(result["success"] for result in results):
+            return missing
+        return self.find_missing_modules(plan)
+
+    async def execute_code(self, websocket: WebSocket, code: str, job_id: str = None,
+                           limits: ExecutionLimits = None, session=None) -> dict:
+        """Execute code with interactive support.
+
+        When ``session`` is given, the job runs on the session's worker and in its namespace.
+        """
+        job = ExecutionJob(job_id or uuid.uuid4().hex, websocket, limits or ExecutionLimits())
+        key = (websocket, job.job_id)
+        if key in self.running_tasks:
+            return {
+                "status": "error",
+                "job_id": job.job_id,
+                "error": f"Job {job.job_id} is already running"
+            }
+        job.task = asyncio.ensure_future(self._run(job, code, session))
+        self.running_tasks[key] = job
+        try:
+            result = await job.task
+            executions_total.inc(status=result.get("status", "unknown"))
+            return result
+        except asyncio.CancelledError:
+            if not job.cancelled:
+                raise
+            executions_total.inc(status="cancelled")
+            return {
+                "type": "execution_cancelled",
+                "status": "cancelled",
+                "job_id": job.job_id,
+                "execution_time": f"{time.time() - job.started_at:.3f}s"
+            }
+        finally:
+            self.running_tasks.pop(key, None)
 
-class DashboardIO:
-    def __init__(self, websocket):
-        self.websocket = websocket
-        self.input_buffer = asyncio.Queue()
-        self.output_buffer = []
-
-    async def ainput(self, prompt=''):
-        # Send prompt to the dashboard
-        await self.websocket.send_json({{
-            "type": "interactive_input_request",
-            "content": prompt
-        }})
-        # Wait for input from the dashboard
-        data = await self.websocket.receive_json()
-        return data.get('value', '')
-
-    async def print(self, *args, **kwargs):
-        output = ' '.join(str(arg) for arg in args)
-        self.output_buffer.append(output)
-
-        # Send output to the dashboard
-        await self.websocket.send_json({{
-            "type": "interactive_output",
-            "content": output + kwargs.get('end', '\\n')
-        }})
-
-dashboard_io = DashboardIO(websocket)  # Pass websocket to DashboardIO
-
-async def run_interactive():
-    try:
-{self.indent_code(code, 8)}
-    except Exception as e:
-        await dashboard_io.print(f"Error: {{str(e)}}")
-
-# Create event loop and run the code
-asyncio.run(run_interactive())
-"""
-        return wrapped_code
-
-    def indent_code(self, code: str, spaces: int) -> str:
-        """Indent code by specified number of spaces."""
-        return '\n'.join(' ' * spaces + line if line.strip() else line
-                         for line in code.split('\n'))
-
-    async def execute_code(self, websocket: WebSocket, code: str) -> dict:
-        """Execute code with interactive support."""
-        self.output_buffer = StringIO()
-        self.current_websocket = websocket
+    async def _run(self, job: ExecutionJob, code: str, session=None) -> dict:
         start_time = time.time()
-
+        websocket = job.websocket
+        job.output = OutputChannel(websocket.send_json if websocket else None, job.job_id)
         try:
-            # Clean and prepare code
-            cleaned_code = self.extract_python_code(code)
-
-            # Check for syntax errors
-            try:
-                compile(cleaned_code, '<string>', 'exec')
-            except SyntaxError as e:
+            # Clean, validate and compile the code (cached by source hash)
+            snippet = compile_cache.get_or_compile(code, self.compile_snippet)
+            if snippet.syntax_error is not None:
+                e = snippet.syntax_error
                 return {
                     "status": "error",
+                    "job_id": job.job_id,
                     "error": f"Syntax Error: {str(e)}",
                     "line": e.lineno,
-                    "suggestion": self.get_error_suggestion(e)
+                    "suggestion": self.get_error_suggestion(e, snippet.plan)
+                }
+            job.interactive_mode = snippet.interactive
+
+            # Install missing dependencies from the local wheelhouse and report the rest
+            missing = self.find_missing_modules(snippet.plan)
+            if missing and package_installer.auto_install:
+                missing = await self.install_missing(job, snippet.plan, missing)
+            if missing and websocket:
+                for name in missing:
+                    await websocket.send_json({
+                        "type": "resource_missing",
+                        "job_id": job.job_id,
+                        "resource": name
+                    })
+            # Only an unconditional top-level import is sure to fail, so only those stop the
+            # run up front; guarded or unreached imports are left to the code itself
+            required = [name for name in missing if name in snippet.plan.required_imports]
+            if required:
+                error = f"No module named {', '.join(repr(name) for name in required)}"
+                return {
+                    "status": "error",
+                    "job_id": job.job_id,
+                    "error_type": "ModuleNotFoundError",
+                    "error": error,
+                    "missing_modules": missing,
+                    "suggestion": self.build_suggestion("ModuleNotFoundError", error, snippet.plan)
                 }
 
-            # Detect if code is interactive
-            self.interactive_mode = 'input(' in cleaned_code or 'while True' in cleaned_code
-
-            if self.interactive_mode:
-                wrapped_code = self.wrap_interactive_code(cleaned_code)
-            else:
-                wrapped_code = cleaned_code
-
-            # Execute the code
-            local_vars = {}
-            with self.capture_output(websocket):
-                if self.interactive_mode:
-                    exec(wrapped_code, {
-                        "print": print,
-                        "websocket": websocket
-                    }, local_vars)
-                else:
-                    # If the code is NOT a single expression, use exec()
-                    if cleaned_code.endswith('\n'):  
-                        exec(wrapped_code, {
-                            "print": print,
-                            "websocket": websocket
-                        }, local_vars)
-                    else:
-                        result = eval(cleaned_code, {}, local_vars)
-                        print(result)  # Print the result of the expression
+            payload = {"code": snippet.code_bytes, "mode": snippet.mode, "max_output": job.output.max_output,
+                       "packages_version": package_installer.version}
+            worker = None
+            if session is not None and session.persistent:
+                payload["namespace"] = session.session_id
+                worker = await session.get_worker()
+
+            # Execute the code in a pooled worker process
+            with metrics.time("executor_stage_seconds", stage="exec"):
+                job_result = await worker_pool.run(
+                    payload,
+                    on_output=job.output.write,
+                    on_input=self._input_handler(job),
+                    limits=job.limits,
+                    on_truncated=job.output.mark_truncated,
+                    worker=worker
+                )
+            await job.output.close()
+            if job_result["status"] == "error":
+                return {
+                    "status": "error",
+                    "job_id": job.job_id,
+                    "error_type": job_result["error_type"],
+                    "error": job_result["error"],
+                    "traceback": job_result["traceback"],
+                    "suggestion": self.build_suggestion(
+                        job_result["error_type"], job_result["error"], snippet.plan)
+                }
+            local_vars = job_result["variables"]
 
             execution_time = time.time() - start_time
-            output = self.output_buffer.getvalue()
-
-            # Send an execution complete message (only if websocket is available)
-            if websocket:
-                await websocket.send_json({
-                    "type": "execution_result",
-                    "output": output,
-                    "execution_time": f"{execution_time:.3f}s",
-                    "success": True
-                })
+            with metrics.time("executor_stage_seconds", stage="serialize"):
+                output = job.output.getvalue()
+
+                # Send an execution complete message (only if websocket is available)
+                if websocket:
+                    message = {
+                        "type": "execution_result",
+                        "job_id": job.job_id,
+                        "execution_time": f"{execution_time:.3f}s",
+                        "truncated": job.output.truncated,
+                        "success": True
+                    }
+                    if job.output.frames_sent and not job.output.failed:
+                        # The client already has every byte from the execution_output frames
+                        message["streamed"] = True
+                    else:
+                        message["output"] = output
+                    await websocket.send_json(message)
 
             return {
                 "status": "success",
+                "job_id": job.job_id,
                 "output": output,
                 "execution_time": f"{execution_time:.3f}s",
-                "interactive": self.interactive_mode,
-                "variables": {
-                    k: str(v)
-                    for k, v in local_vars.items() if not k.startswith('_')
-                }
+                "truncated": job.output.truncated,
+                "interactive": job.interactive_mode,
+                "analysis": snippet.plan.to_dict(),
+                "variables": local_vars
             }
 
         except Exception as e:
             return {
                 "status": "error",
+                "job_id": job.job_id,
                 "error_type": type(e).__name__,
                 "error": str(e),
                 "traceback": traceback.format_exc(),
                 "suggestion": self.get_error_suggestion(e)
             }
         finally:
-            self.current_websocket = None
-            self.interactive_mode = False
+            job.output.cancel()
+
+    def _input_handler(self, job: ExecutionJob):
+        """Ask the dashboard for input on behalf of the running code."""
+        async def on_input(prompt: str) -> str:
+            if not job.websocket:
+                return ''
+            await job.websocket.send_json({
+                "type": "interactive_input_request",
+                "job_id": job.job_id,
+                "content": prompt
+            })
+            job.awaiting_input = True
+            try:
+                return await job.input_queue.get()
+            finally:
+                job.awaiting_input = False
+        return on_input
 
-    def get_error_suggestion(self, error: Exception) -> str:
+    def get_error_suggestion(self, error: Exception, plan: CodePlan = None) -> str:
         """Generate helpful suggestions for common errors."""
-        error_str = str(error)
+        return self.build_suggestion(type(error).__name__, str(error), plan)
 
+    def build_suggestion(self, error_type: str, error_str: str, plan: CodePlan = None) -> str:
+        """Generate a suggestion from an error type name and message, refined by the code's plan."""
         suggestions = {
             "NameError": "Make sure all variables are defined before use. Check for typos in variable names.",
             "TypeError": "Check that you're using compatible types and correct number of arguments.",
@@ -228,38 +330,210 @@ asyncio.run(run_interactive())
             "IndexError": "Make sure you're not trying to access list indices that don't exist.",
             "KeyError": "Verify that the dictionary key exists before accessing it.",
             "AttributeError": "Check that the object has the attribute or method you're trying to use.",
-            "ImportError": "Ensure the module is installed and imported correctly."
+            "ImportError": "Ensure the module is installed and imported correctly.",
+            "ModuleNotFoundError": "Install the missing module or remove the import.",
+            "TimeLimitExceeded": "Make sure loops have an exit condition, or request a longer wall_time limit.",
+            "CPUTimeLimitExceeded": "Reduce the amount of computation or look for an infinite loop.",
+            "MemoryLimitExceeded": "Process data in smaller chunks instead of holding it all in memory."
         }
 
-        error_type = type(error).__name__
         base_suggestion = suggestions.get(
             error_type, "Review the error message and check your code logic.")
 
+        if plan is not None:
+            if error_type in ("TimeLimitExceeded", "CPUTimeLimitExceeded") and plan.has_unbounded_loops:
+                lines = ', '.join(str(line) for line in plan.unbounded_loop_lines)
+                base_suggestion = f"The loop on line(s) {lines} never breaks. Add an exit condition."
+            elif error_type == "EOFError" and plan.needs_input:
+                base_suggestion = "The code reads input. Enter a value in the interactive panel when prompted."
+
         return f"{base_suggestion}\nError details: {error_str}"
 
 
 code_executor = CodeExecutor()
 
 
+class ExecutionSession:
+    """One connection's execution context: an ordered job queue and an optional REPL namespace.
+
+    Jobs from the same session run one after another; different sessions run concurrently
+    on the worker pool. A persistent session leases its own worker so variables survive
+    between jobs, and gets a fresh one if that worker is killed.
+    """
+
+    def __init__(self, session_id: str, websocket, persistent: bool = False, max_queue: int = None):
+        self.session_id = session_id
+        self.websocket = websocket
+        self.persistent = persistent
+        self.queue = asyncio.Queue(maxsize=max_queue or int(os.getenv("EXECUTOR_SESSION_QUEUE_SIZE", "32")))
+        self.worker = None
+        self.current_job_id = None
+        self.queued_ids = set()
+        self.cancelled_ids = set()
+        self._runner = asyncio.ensure_future(self._run_queue())
+
+    def submit(self, code: str, job_id: str, limits: ExecutionLimits) -> bool:
+        try:
+            self.queue.put_nowait((job_id, code, limits))
+            self.queued_ids.add(job_id)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel the running job, or drop a job that is still waiting in the queue."""
+        if job_id and job_id == self.current_job_id:
+            return code_executor.cancel(self.websocket, job_id)
+        if job_id in self.queued_ids:
+            self.cancelled_ids.add(job_id)
+            return True
+        return False
+
+    async def get_worker(self):
+        """Return the session's leased worker, leasing a new one if there is none alive."""
+        if self.worker is not None and not self.worker.alive:
+            await worker_pool.end_lease(self.worker)
+            self.worker = None
+            await self.websocket.send_json({"type": "namespace_reset", "session_id": self.session_id})
+        if self.worker is None:
+            self.worker = await worker_pool.lease()
+        return self.worker
+
+    async def reset(self):
+        """Drop the session's namespace by releasing its worker, cancelling the job running on it first."""
+        job = code_executor.running_tasks.get((self.websocket, self.current_job_id))
+        if job is not None and code_executor.cancel(self.websocket, job.job_id):
+            # The job still owns the worker's pipe until its task has unwound
+            await asyncio.wait({job.task})
+        if self.worker is not None:
+            await worker_pool.end_lease(self.worker)
+            self.worker = None
+
+    async def _run_queue(self):
+        while True:
+            job_id, code, limits = await self.queue.get()
+            self.queued_ids.discard(job_id)
+            if job_id in self.cancelled_ids:
+                self.cancelled_ids.discard(job_id)
+                await self.websocket.send_json({
+                    "type": "execution_cancelled",
+                    "status": "cancelled",
+                    "job_id": job_id
+                })
+                continue
+            self.current_job_id = job_id
+            try:
+                await self.websocket.send_json({"type": "execution_started", "job_id": job_id})
+                result = await code_executor.execute_code(self.websocket, code, job_id, limits, session=self)
+                # The output already went out in execution_output/execution_result frames
+                result.pop("output", None)
+                await self.websocket.send_json(result)
+            except Exception as e:
+                logger.error(f"Execution job {job_id} failed: {str(e)}")
+            finally:
+                self.current_job_id = None
+
+    async def close(self):
+        self._runner.cancel()
+        code_executor.cancel_all(self.websocket)
+        await self.reset()
+
+
+class SessionManager:
+    """Creates and tracks one ExecutionSession per /ws/execute connection."""
+
+    def __init__(self):
+        self.sessions = {}
+
+    def open(self, websocket, persistent: bool = False) -> ExecutionSession:
+        """Start a session, or return None if it is persistent and every session worker is taken."""
+        if persistent and sum(s.persistent for s in self.sessions.values()) >= worker_pool.max_leases:
+            return None
+        session = ExecutionSession(uuid.uuid4().hex, websocket, persistent)
+        self.sessions[session.session_id] = session
+        return session
+
+    async def close(self, session: ExecutionSession):
+        self.sessions.pop(session.session_id, None)
+        await session.close()
+
+
+session_manager = SessionManager()
+
+
+async def install_package(websocket, module: str, job_id: str = None) -> dict:
+    """Install ``module`` for the client on ``websocket``, streaming pip's output to it."""
+    async def send(data: dict):
+        if websocket is None:
+            return
+        try:
+            await websocket.send_json(dict(data, job_id=job_id) if job_id else data)
+        except Exception:
+            pass
+
+    async def on_output(line: str):
+        await send({"type": "install_output", "package": module, "content": line})
+
+    await send({"type": "install_started", "package": module})
+    result = await package_installer.install(module, on_output)
+    await send(dict(result, type="install_result", module=module))
+    return result
+
+
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    logger.info("New execution WebSocket connection established")
+    persistent = websocket.query_params.get('persistent', '').lower() in ('1', 'true', 'yes')
+    session = session_manager.open(websocket, persistent)
+    if session is None:
+        await websocket.send_json({
+            "type": "error",
+            "error": f"Too many persistent sessions (limit {worker_pool.max_leases}); try again later"
+        })
+        await websocket.close(code=1013)
+        return
+    logger.info(f"New execution WebSocket connection established (session {session.session_id})")
     try:
+        await websocket.send_json({
+            "type": "session_started",
+            "session_id": session.session_id,
+            "persistent": session.persistent
+        })
         while True:
             data = await websocket.receive_json()
-            code = data.get('code', '')
+            message_type = data.get('type')
 
-            if data.get('type') == 'input':
+            if message_type == 'input':
                 # Handle interactive input
-                if code_executor.current_websocket and code_executor.interactive_mode:
-                    await code_executor.current_websocket.send_json({
-                        "type": "interactive_input",
-                        "value": data.get('value', '')
-                    })
+                code_executor.provide_input(websocket, data.get('value', ''), data.get('job_id'))
+            elif message_type == 'cancel':
+                job_id = data.get('job_id')
+                await websocket.send_json({
+                    "type": "cancel_result",
+                    "job_id": job_id,
+                    "cancelled": session.cancel(job_id)
+                })
+            elif message_type == 'install_package':
+                # Runs alongside the session so the connection stays responsive during pip
+                asyncio.ensure_future(install_package(websocket, data.get('package', '')))
+            elif message_type == 'reset_session':
+                await session.reset()
+                await websocket.send_json({"type": "namespace_reset", "session_id": session.session_id})
             else:
-                # Execute code
-                result = await code_executor.execute_code(websocket, code)
-                await websocket.send_json(result)
+                # Queue the code on this connection's session
+                job_id = data.get('job_id') or uuid.uuid4().hex
+                limits = ExecutionLimits.from_request(data.get('limits'))
+                if session.submit(data.get('code', ''), job_id, limits):
+                    await websocket.send_json({
+                        "type": "execution_queued",
+                        "job_id": job_id,
+                        "position": session.queue.qsize()
+                    })
+                else:
+                    await websocket.send_json({
+                        "type": "error",
+                        "job_id": job_id,
+                        "error": "Too many queued executions for this session"
+                    })
 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
@@ -268,4 +542,6 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.send_json({
             "type": "error",
             "error": str(e)
-        })
\ No newline at end of file
+        })
+    finally:
+        await session_manager.close(session)
@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import marshal
+import os
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CompiledSnippet:
+    """Cleaned source, its analysis plan and compiled code object, or the SyntaxError it raised."""
+
+    def __init__(self, source: str, plan, code=None, syntax_error: SyntaxError = None):
+        self.source = source
+        self.plan = plan
+        self.code = code
+        self.syntax_error = syntax_error
+        self._code_bytes = None
+
+    @property
+    def mode(self) -> str:
+        return self.plan.mode
+
+    @property
+    def interactive(self) -> bool:
+        return self.plan.interactive
+
+    @property
+    def code_bytes(self) -> bytes:
+        """Marshalled code object, ready to be sent to a worker process."""
+        if self._code_bytes is None and self.code is not None:
+            self._code_bytes = marshal.dumps(self.code)
+        return self._code_bytes
+
+
+class CompileCache:
+    """Bounded LRU cache mapping a snippet's source hash to its CompiledSnippet."""
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or int(os.getenv("EXECUTOR_COMPILE_CACHE_SIZE", "256"))
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get(self, content: str):
+        key = self.key(content)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, content: str, entry: CompiledSnippet):
+        key = self.key(content)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compile(self, content: str, compiler) -> CompiledSnippet:
+        """Return the cached snippet for ``content``, building it with ``compiler`` on a miss."""
+        entry = self.get(content)
+        if entry is None:
+            entry = compiler(content)
+            self.put(content, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+compile_cache = CompileCache()
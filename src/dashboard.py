@@ -1,19 +1,92 @@
-from fastapi import FastAPI, WebSocket
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-import os
 from dotenv import load_dotenv
+import os
 
-# Import websocket_endpoint directly
-from llm_integration import websocket_endpoint as llm_websocket_endpoint 
-from code_executor import websocket_endpoint as executor_websocket_endpoint
-
-# Load environment variables
+# Load environment variables before the modules below read them at import time
 load_dotenv(os.path.join("config", ".env"))
 
-app = FastAPI(title="Development Dashboard")
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+# Import websocket_endpoint directly; the SDKs behind them load on first use
+from llm_integration import llm, websocket_endpoint as llm_websocket_endpoint
+from code_executor import session_manager, code_executor, websocket_endpoint as executor_websocket_endpoint
+from worker_pool import worker_pool
+from package_installer import package_installer
+from compile_cache import compile_cache
+from metrics import metrics, LoopLagMonitor
+from github_integration import setup_routes as setup_github_routes, websocket_endpoint as github_websocket_endpoint
+from live_updates import live_updates, setup_routes as setup_live_routes, websocket_endpoint as live_websocket_endpoint
+from mux import multiplexer, setup_routes as setup_mux_routes
+from static_assets import static_assets
+from workspace_files import workspace_files, setup_routes as setup_workspace_routes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The loop only keeps weak references to tasks, so fire-and-forget ones are held here
+background_tasks = set()
+
+
+def run_in_background(coroutine, description: str):
+    """Run ``coroutine`` without awaiting it, logging it if it fails."""
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+
+    def done(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"{description} failed: {str(task.exception())}")
+
+    task.add_done_callback(done)
+    return task
+
+metrics.gauge("websocket_connections", "Open WebSocket connections", label="endpoint", callback=lambda: {
+    "execute": len(session_manager.sessions),
+    "llm": len(llm.connections),
+    "updates": len(live_updates.hub.clients),
+    "mux": len(multiplexer.connections)
+})
+metrics.gauge("executor_jobs_running", "Executions in progress", callback=lambda: len(code_executor.running_tasks))
+metrics.gauge("executor_workers", "Execution worker processes", callback=lambda: {
+    "total": len(worker_pool.workers),
+    "leased": worker_pool.leases,
+    "idle": worker_pool._idle.qsize() if worker_pool._idle is not None else 0
+})
+metrics.gauge("workspace_files_indexed", "Files in the workspace index",
+              callback=lambda: len(workspace_files.paths) if workspace_files.paths is not None else 0)
+metrics.gauge("compile_cache_hit_ratio", "Compile cache hit rate", callback=lambda: compile_cache.stats()["hit_rate"])
+loop_lag_monitor = LoopLagMonitor(metrics)
+
+# Index the same files the watcher reports on, so its events keep the index complete
+workspace_files.matches = live_updates.event_handler.aggregator.matches
+workspace_files.ignores = live_updates.event_handler.aggregator.ignores
+# and broadcast changes under the names /api/files lists
+live_updates.relative = workspace_files.relative
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag_monitor.start()
+    # Workers inherit sys.path when they start, so the install directory goes on it first
+    package_installer.prepare()
+    # Warm the workers (and their preloaded imports) in the background instead of on the first run
+    run_in_background(worker_pool.start(), "Starting the executor workers")
+    await asyncio.to_thread(static_assets.load)
+    paths = [path for path in os.getenv("LIVE_UPDATES_PATHS", ".").split(os.pathsep) if path]
+    live_updates.add_listener(reload_static_assets)
+    live_updates.add_listener(workspace_files.apply_changes)
+    live_updates.start(asyncio.get_running_loop(), paths)
+    try:
+        yield
+    finally:
+        live_updates.stop()
+        await worker_pool.shutdown()
+        await loop_lag_monitor.stop()
+
+app = FastAPI(title="Development Dashboard", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,16 +96,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def reload_static_assets(changes: list):
+    paths = [change["path"] for change in changes] + [change["src_path"] for change in changes if "src_path" in change]
+    run_in_background(asyncio.to_thread(static_assets.refresh, paths), "Reloading static assets")
+
+@app.get("/static/{name:path}")
+async def get_static(name: str, request: Request):
+    return static_assets.response(request, name)
 
 # Use websocket_endpoint in your router
 app.websocket("/ws/llm")(llm_websocket_endpoint)  
 app.websocket("/ws/execute")(executor_websocket_endpoint)
+setup_github_routes(app)
+setup_live_routes(app)
+setup_workspace_routes(app)
+
+# The same endpoints, reachable as streams of one /ws/mux connection
+multiplexer.register("llm", llm_websocket_endpoint)
+multiplexer.register("execute", executor_websocket_endpoint)
+multiplexer.register("github", github_websocket_endpoint)
+multiplexer.register("updates", live_websocket_endpoint)
+setup_mux_routes(app)
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/json")
+async def get_metrics_json():
+    return metrics.to_dict()
 
-@app.get("/", response_class=HTMLResponse)
-async def get_index():
-    with open("static/index.html") as f:
-        return f.read()
+@app.get("/")
+async def get_index(request: Request):
+    return static_assets.response(request, "index.html")
 
 if __name__ == "__main__":
-    uvicorn.run("dashboard:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    import uvicorn
+    # Only reload for source edits; static assets and the cache directory reload themselves
+    uvicorn.run("dashboard:app", host="0.0.0.0", port=8000, reload=True,
+                reload_dirs=[os.path.dirname(os.path.abspath(__file__))])
\ No newline at end of file
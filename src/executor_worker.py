@@ -0,0 +1,8 @@
+"""Stand-in ``__main__`` for executor worker processes.
+
+With the spawn and forkserver start methods, multiprocessing re-runs the parent's
+``__main__`` module in every child (as ``__mp_main__``), which for the dashboard would
+import the whole server into each worker. ``WorkerPool`` starts its workers with this
+module in that role instead, so they only import the worker code itself.
+"""
+from worker_pool import _worker_main  # noqa: F401
@@ -0,0 +1,167 @@
+import difflib
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Lines end at "\n" only; str.splitlines also breaks at "\r", "\f" and other separators,
+# which the client (splitting on "\n") would count differently
+LINE_END = re.compile(r"(?<=\n)")
+
+
+def split_lines(text: str) -> list:
+    """``text`` split after each "\n", keeping the line ends."""
+    lines = LINE_END.split(text)
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class SnapshotStore:
+    """Remembers the last content hash (and, for small text files, the lines) of each path.
+
+    ``annotate`` turns a watcher change into a delta: it returns None when the content
+    hash is unchanged (touch-only saves), a line diff against the previous snapshot when
+    there is one, or the full content when that is smaller than the diff. Snapshots are
+    evicted least-recently-changed first once they exceed ``max_bytes``; files larger than
+    ``max_file_bytes`` only keep their hash. ``seed`` records files as they are at
+    startup, so the first save that does not change a file is not reported either.
+    """
+
+    def __init__(self, max_bytes: int = None, max_file_bytes: int = None):
+        self.max_bytes = max_bytes or int(os.getenv("LIVE_UPDATES_SNAPSHOT_BYTES", str(16 * 1024 * 1024)))
+        self.max_file_bytes = max_file_bytes or int(os.getenv("LIVE_UPDATES_SNAPSHOT_FILE_BYTES", str(256 * 1024)))
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.snapshots = OrderedDict()
+        self.snapshot_bytes = 0
+        self.unchanged = 0
+        self.diffs = 0
+        self.full = 0
+
+    def _drop(self, path: str):
+        lines = self.snapshots.pop(path, None)
+        if lines is not None:
+            self.snapshot_bytes -= sum(len(line) for line in lines)
+
+    def remember(self, path: str, content: str, digest: str = None):
+        """Record ``content`` as what clients last saw for ``path``."""
+        digest = digest or hashlib.sha256(content.encode("utf-8", "surrogateescape")).hexdigest()
+        with self.lock:
+            self._remember(path, content, digest)
+
+    def _remember(self, path: str, content, digest: str):
+        self.hashes[path] = digest
+        self._drop(path)
+        if content is None or len(content) > self.max_file_bytes:
+            return
+        self.snapshots[path] = split_lines(content)
+        self.snapshot_bytes += len(content)
+        while self.snapshot_bytes > self.max_bytes and self.snapshots:
+            self._drop(next(iter(self.snapshots)))
+
+    def seed(self, path: str):
+        """Record ``path`` as it is now, unless a change to it has been recorded already."""
+        try:
+            digest, text = self._read(path, self.max_file_bytes)
+        except OSError:
+            return
+        with self.lock:
+            if path not in self.hashes:
+                self._remember(path, text, digest)
+
+    def forget(self, path: str):
+        with self.lock:
+            self.hashes.pop(path, None)
+            self._drop(path)
+
+    def move(self, src_path: str, dest_path: str):
+        with self.lock:
+            if src_path in self.hashes:
+                self.hashes[dest_path] = self.hashes.pop(src_path)
+            lines = self.snapshots.pop(src_path, None)
+            if lines is not None:
+                self.snapshots[dest_path] = lines
+
+    @staticmethod
+    def _read(path: str, limit: int):
+        """(digest, text or None) for ``path``; text is None for large or binary files."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            data = f.read(limit + 1)
+            digest.update(data)
+            text = None
+            if len(data) <= limit:
+                try:
+                    text = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+            else:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        return digest.hexdigest(), text
+
+    def annotate(self, change: dict):
+        """Add hash and delta fields to a change, or return None if nothing really changed."""
+        path = change["path"]
+        if change["event"] == "deleted":
+            self.forget(path)
+            return change
+        if change["event"] == "moved":
+            self.move(change["src_path"], path)
+        try:
+            digest, text = self._read(path, self.max_file_bytes)
+        except OSError:
+            # Gone again before we got to it; the next event will say so
+            return change
+
+        with self.lock:
+            base_hash = self.hashes.get(path)
+            base_lines = self.snapshots.get(path)
+            if base_lines is not None:
+                self.snapshots.move_to_end(path)
+        if digest == base_hash:
+            if change["event"] == "modified":
+                self.unchanged += 1
+                return None
+            return dict(change, hash=digest)
+
+        change = dict(change, hash=digest, base_hash=base_hash)
+        if text is None:
+            self.remember_hash(path, digest)
+            return change
+        self.remember(path, text, digest)
+        if base_lines is None:
+            return change
+
+        lines = split_lines(text)
+        matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+        # Each op replaces base lines [start, end) with the given lines
+        diff = [[i1, i2, lines[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+        if sum(len(line) for _, _, new in diff for line in new) < len(text):
+            self.diffs += 1
+            change["diff"] = diff
+        else:
+            self.full += 1
+            change["content"] = text
+        return change
+
+    def remember_hash(self, path: str, digest: str):
+        with self.lock:
+            self._remember(path, None, digest)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "files": len(self.hashes),
+                "snapshots": len(self.snapshots),
+                "snapshot_bytes": self.snapshot_bytes,
+                "unchanged": self.unchanged,
+                "diffs": self.diffs,
+                "full": self.full
+            }
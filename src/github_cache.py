@@ -0,0 +1,189 @@
+import logging
+import os
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+from metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+cache_lookups = metrics.counter("github_cache_lookups_total", "GitHub reads by cache outcome")
+
+
+class GitHubContentCache:
+    """Content-addressed cache for GitHub reads.
+
+    File contents are stored once per blob sha. Directory listings are stored per path
+    with the ETag they were served with (for If-None-Match revalidation) and per tree sha.
+    A sha learned from a listing that was revalidated less than ``max_age`` seconds ago
+    is trusted without asking GitHub again. All methods are thread-safe, since GitHub
+    calls run on a thread pool.
+    """
+
+    def __init__(self, max_bytes: int = None, max_age: float = None):
+        self.max_bytes = max_bytes or int(os.getenv("GITHUB_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.max_age = float(os.getenv("GITHUB_CACHE_MAX_AGE", "30")) if max_age is None else max_age
+        self.lock = threading.Lock()
+        self.blobs = OrderedDict()
+        self.blob_bytes = 0
+        self.trees = OrderedDict()
+        self.listings = {}
+        self.file_etags = {}
+        self.path_shas = {}
+        self.indexes = {}
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    def record(self, outcome: str):
+        """Count a lookup as a "hits", "not_modified" or "misses" outcome."""
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        cache_lookups.inc(outcome=outcome)
+
+    # Blobs
+
+    def get_blob(self, sha: str):
+        with self.lock:
+            content = self.blobs.get(sha)
+            if content is not None:
+                self.blobs.move_to_end(sha)
+            return content
+
+    def put_blob(self, sha: str, content: str):
+        with self.lock:
+            if sha in self.blobs:
+                self.blobs.move_to_end(sha)
+                return
+            self.blobs[sha] = content
+            self.blob_bytes += len(content)
+            while self.blob_bytes > self.max_bytes and len(self.blobs) > 1:
+                _, evicted = self.blobs.popitem(last=False)
+                self.blob_bytes -= len(evicted)
+
+    # Paths and listings
+
+    def fresh_sha(self, path: str):
+        """The sha last seen for ``path`` in a listing, if that listing is still fresh."""
+        with self.lock:
+            entry = self.path_shas.get(path)
+            if entry is None or time.time() - entry[1] > self.max_age:
+                return None
+            return entry[0]
+
+    def get_tree(self, sha: str):
+        with self.lock:
+            items = self.trees.get(sha)
+            if items is not None:
+                self.trees.move_to_end(sha)
+            return items
+
+    def get_listing(self, path: str):
+        with self.lock:
+            return self.listings.get(path)
+
+    def put_listing(self, path: str, etag: str, items: list, tree_sha: str = None):
+        now = time.time()
+        with self.lock:
+            self.listings[path] = {"etag": etag, "items": items}
+            if tree_sha:
+                self._put_tree(tree_sha, items)
+            for item in items:
+                self.path_shas[item["path"]] = (item["sha"], now)
+
+    def _put_tree(self, sha: str, items: list):
+        self.trees[sha] = items
+        self.trees.move_to_end(sha)
+        while len(self.trees) > 1024:
+            self.trees.popitem(last=False)
+
+    # Whole-tree indexes
+
+    def get_index(self, branch: str):
+        with self.lock:
+            return self.indexes.get(branch)
+
+    def put_index(self, branch: str, index: dict):
+        """Store a recursive tree and derive every directory listing in it from its entries."""
+        now = time.time()
+        directories = {"": []}
+        for entry in index["entries"]:
+            if entry["type"] == "directory":
+                directories.setdefault(entry["path"], [])
+        for entry in index["entries"]:
+            parent = directories.get(posixpath.dirname(entry["path"]))
+            if parent is not None:
+                parent.append({key: entry[key] for key in ("name", "path", "type", "sha")})
+        tree_shas = {entry["path"]: entry["sha"] for entry in index["entries"] if entry["type"] == "directory"}
+        tree_shas[""] = index["tree_sha"]
+        with self.lock:
+            self.indexes[branch] = index
+            # A truncated index is missing entries, so its listings cannot be trusted
+            if not index["truncated"]:
+                for path, items in directories.items():
+                    self._put_tree(tree_shas[path], items)
+            for entry in index["entries"]:
+                self.path_shas[entry["path"]] = (entry["sha"], now)
+            self.path_shas[""] = (index["tree_sha"], now)
+
+    def touch_index(self, branch: str):
+        """Mark an index (and the shas in it) as just revalidated against its branch head."""
+        now = time.time()
+        with self.lock:
+            index = self.indexes.get(branch)
+            if index is None:
+                return
+            for entry in index["entries"]:
+                self.path_shas[entry["path"]] = (entry["sha"], now)
+            self.path_shas[""] = (index["tree_sha"], now)
+
+    def drop_index(self, branch: str):
+        with self.lock:
+            self.indexes.pop(branch, None)
+
+    def touch_listing(self, path: str):
+        """Mark a listing (and the shas in it) as just revalidated."""
+        now = time.time()
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is None:
+                return
+            for item in listing["items"]:
+                self.path_shas[item["path"]] = (item["sha"], now)
+
+    def get_file_etag(self, path: str):
+        with self.lock:
+            return self.file_etags.get(path)
+
+    def put_file(self, path: str, sha: str, content: str, etag: str = None):
+        self.put_blob(sha, content)
+        with self.lock:
+            if etag:
+                self.file_etags[path] = (etag, sha)
+            self.path_shas[path] = (sha, time.time())
+
+    def invalidate(self, path: str):
+        """Forget ``path`` and every directory listing above it after a write."""
+        with self.lock:
+            self.file_etags.pop(path, None)
+            self.path_shas.pop(path, None)
+            directory = path
+            while directory:
+                directory = posixpath.dirname(directory)
+                self.listings.pop(directory, None)
+                self.path_shas.pop(directory, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "blobs": len(self.blobs),
+                "blob_bytes": self.blob_bytes,
+                "trees": len(self.trees),
+                "listings": len(self.listings),
+                "indexes": len(self.indexes),
+                "hits": self.hits,
+                "not_modified": self.not_modified,
+                "misses": self.misses
+            }
@@ -1,35 +1,148 @@
-from github import Github
 from fastapi import FastAPI, WebSocket
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import os
 import base64
+import hashlib
 import json
 import logging
+import posixpath
+import time
+from urllib.parse import quote
+from github_cache import GitHubContentCache
+from metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+github_calls = metrics.counter("github_calls_total", "GitHub operations by outcome")
+github_seconds = metrics.histogram("github_call_seconds", "GitHub operation latency")
+
 class GitHubIntegration:
-    def __init__(self):
-        self.github = Github(os.getenv("GITHUB_TOKEN"))
+    """Async facade over PyGithub.
+
+    PyGithub is synchronous, so every call runs on a bounded thread pool and is given
+    ``timeout`` seconds to finish; the event loop never waits on the network. The repo
+    handle is resolved on first use rather than at import time. Point ``GITHUB_API_URL``
+    at a local stand-in (or pass ``client``) to run without github.com.
+    """
+
+    def __init__(self, client=None, max_workers: int = None, timeout: float = None):
+        self.token = os.getenv("GITHUB_TOKEN")
         self.repo_name = os.getenv("GITHUB_REPO")
-        self.repo = self.github.get_repo(self.repo_name)
-        
+        self.base_url = os.getenv("GITHUB_API_URL", "https://api.github.com")
+        self.max_workers = max_workers or int(os.getenv("GITHUB_MAX_WORKERS", "8"))
+        self.timeout = timeout or float(os.getenv("GITHUB_TIMEOUT", "15"))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="github")
+        self.cache = GitHubContentCache()
+        self._github = client
+        self._repo = None
+        self._repo_lock = None
+
+    @property
+    def github(self):
+        if self._github is None:
+            # PyGithub is imported here so that importing this module stays cheap
+            from github import Github
+            # Size the HTTP connection pool to match the threads that share it
+            self._github = Github(self.token, base_url=self.base_url,
+                                  timeout=int(self.timeout), pool_size=self.max_workers)
+        return self._github
+
+    async def run(self, operation: str, func, *args, **kwargs):
+        """Run a blocking PyGithub call on the thread pool, bounded by the timeout."""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+            outcome = "ok"
+            return result
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise TimeoutError(f"GitHub {operation} timed out after {self.timeout:g}s")
+        finally:
+            github_calls.inc(operation=operation, outcome=outcome)
+            github_seconds.observe(time.perf_counter() - started, operation=operation)
+
+    async def get_repo(self):
+        if self._repo is None:
+            if self._repo_lock is None:
+                self._repo_lock = asyncio.Lock()
+            async with self._repo_lock:
+                if self._repo is None:
+                    if not self.repo_name:
+                        raise ValueError("GITHUB_REPO not found in environment variables")
+                    self._repo = await self.run("get_repo", self.github.get_repo, self.repo_name)
+        return self._repo
+
     async def get_file(self, path: str) -> dict:
         try:
-            content = self.repo.get_contents(path)
-            return {
-                "content": base64.b64decode(content.content).decode(),
-                "sha": content.sha
-            }
+            path = path.strip("/")
+            # A sha from a fresh listing pins the blob; no request needed
+            sha = self.cache.fresh_sha(path)
+            content = self.cache.get_blob(sha) if sha else None
+            if content is not None:
+                self.cache.record("hits")
+                return {"content": content, "sha": sha}
+            repo = await self.get_repo()
+            return await self.run("get_file", self._read_file, repo, path)
         except Exception as e:
             logger.error(f"Error getting file: {str(e)}")
             raise
 
+    @staticmethod
+    def _contents_url(repo, path: str) -> str:
+        return f"{repo.url}/contents/{quote(path)}".rstrip("/")
+
+    @staticmethod
+    def blob_sha(content: str) -> str:
+        """The git blob sha GitHub will assign to ``content``."""
+        data = content.encode("utf-8")
+        return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+    def _conditional_get(self, repo, url: str, etag: str = None):
+        """GET an API URL with If-None-Match; 304 answers do not count against the rate limit.
+
+        Returns (status, etag, data) where data is None for a 304.
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        # PyGithub's public API has no conditional reads, so use its requester directly
+        status, response_headers, body = repo._requester.requestJson("GET", url, headers=headers)
+        if status >= 400:
+            from github import GithubException
+            raise GithubException(status, json.loads(body) if body else None, response_headers)
+        data = json.loads(body) if status != 304 and body else None
+        return status, response_headers.get("etag"), data
+
+    def _read_file(self, repo, path: str) -> dict:
+        cached = self.cache.get_file_etag(path)
+        etag, sha = cached if cached else (None, None)
+        # Only revalidate if we still hold the body the ETag refers to
+        content = self.cache.get_blob(sha) if sha else None
+        status, new_etag, data = self._conditional_get(
+            repo, self._contents_url(repo, path), etag if content is not None else None)
+        if status == 304:
+            self.cache.record("not_modified")
+            self.cache.put_file(path, sha, content)
+            return {"content": content, "sha": sha}
+        self.cache.record("misses")
+        content = self.cache.get_blob(data["sha"])
+        if content is None:
+            content = base64.b64decode(data["content"]).decode()
+        self.cache.put_file(path, data["sha"], content, new_etag)
+        return {"content": content, "sha": data["sha"]}
+
     async def save_file(self, path: str, content: str, message: str, sha: str = None) -> dict:
         try:
+            repo = await self.get_repo()
             if sha:
                 # Update existing file
-                response = self.repo.update_file(
+                response = await self.run(
+                    "save_file",
+                    repo.update_file,
                     path=path,
                     message=message,
                     content=content,
@@ -37,11 +150,15 @@ class GitHubIntegration:
                 )
             else:
                 # Create new file
-                response = self.repo.create_file(
+                response = await self.run(
+                    "save_file",
+                    repo.create_file,
                     path=path,
                     message=message,
                     content=content
                 )
+            self.cache.invalidate(path.strip("/"))
+            self.cache.put_file(path.strip("/"), response["content"].sha, content)
             return {"sha": response["content"].sha}
         except Exception as e:
             logger.error(f"Error saving file: {str(e)}")
@@ -49,24 +166,154 @@ class GitHubIntegration:
 
     async def list_files(self, path: str = "") -> list:
         try:
-            contents = self.repo.get_contents(path)
-            return [{
-                "name": item.name,
-                "path": item.path,
-                "type": "file" if item.type == "file" else "directory",
-                "sha": item.sha
-            } for item in contents]
+            path = path.strip("/")
+            # Listings are content-addressed by tree sha once a parent listing (or the
+            # whole-tree index) told us the sha
+            tree_sha = self.cache.fresh_sha(path)
+            items = self.cache.get_tree(tree_sha) if tree_sha else None
+            if items is not None:
+                self.cache.record("hits")
+                return items
+            repo = await self.get_repo()
+            return await self.run("list_files", self._list_dir, repo, path, tree_sha)
         except Exception as e:
             logger.error(f"Error listing files: {str(e)}")
             raise
 
+    def _list_dir(self, repo, path: str, tree_sha: str = None) -> list:
+        listing = self.cache.get_listing(path)
+        status, etag, data = self._conditional_get(
+            repo, self._contents_url(repo, path), listing["etag"] if listing else None)
+        if status == 304:
+            self.cache.record("not_modified")
+            self.cache.touch_listing(path)
+            return listing["items"]
+        self.cache.record("misses")
+        if not isinstance(data, list):
+            raise ValueError(f"{path or '/'} is not a directory")
+        items = [{
+            "name": item["name"],
+            "path": item["path"],
+            "type": "file" if item["type"] == "file" else "directory",
+            "sha": item["sha"]
+        } for item in data]
+        self.cache.put_listing(path, etag, items, tree_sha)
+        return items
+
+    async def get_tree(self, branch: str = None) -> dict:
+        """Index every path on ``branch`` with one recursive tree request.
+
+        The index also seeds the listing cache, so browsing directories afterwards is
+        served locally until the index goes stale.
+        """
+        try:
+            repo = await self.get_repo()
+            index = await self.run("get_tree", self._read_tree, repo, branch or repo.default_branch)
+            return {key: value for key, value in index.items() if key != "ref_etag"}
+        except Exception as e:
+            logger.error(f"Error getting tree: {str(e)}")
+            raise
+
+    def _read_tree(self, repo, branch: str) -> dict:
+        index = self.cache.get_index(branch)
+        # Trees are immutable by sha; only the branch ref needs revalidating
+        status, etag, data = self._conditional_get(
+            repo, f"{repo.url}/git/ref/heads/{quote(branch)}", index["ref_etag"] if index else None)
+        if status == 304 or (index and data["object"]["sha"] == index["commit_sha"]):
+            self.cache.record("not_modified" if status == 304 else "hits")
+            if etag:
+                index["ref_etag"] = etag
+            self.cache.touch_index(branch)
+            return index
+        self.cache.record("misses")
+        commit_sha = data["object"]["sha"]
+        _, tree = repo._requester.requestJsonAndCheck(
+            "GET", f"{repo.url}/git/trees/{commit_sha}", parameters={"recursive": "1"})
+        index = {
+            "branch": branch,
+            "ref_etag": etag,
+            "commit_sha": commit_sha,
+            "tree_sha": tree["sha"],
+            "truncated": tree.get("truncated", False),
+            "entries": [{
+                "name": posixpath.basename(item["path"]),
+                "path": item["path"],
+                "type": "file" if item["type"] == "blob" else "directory",
+                "sha": item["sha"],
+                "mode": item["mode"],
+                "size": item.get("size")
+            } for item in tree["tree"]]
+        }
+        if index["truncated"]:
+            logger.warning(f"Tree for {branch} was truncated by GitHub; listings fall back to per-directory requests")
+        self.cache.put_index(branch, index)
+        return index
+
+    async def batch_commit(self, changes: list, message: str, branch: str = None, base_sha: str = None) -> dict:
+        """Write many files in one commit through the git data API.
+
+        Each change is ``{"path", "content"}`` or ``{"path", "delete": true}``. If ``base_sha``
+        is given the commit is refused when the branch has moved past it.
+        """
+        try:
+            if not changes:
+                raise ValueError("No changes to commit")
+            for change in changes:
+                if not change.get("path") or (not change.get("delete") and change.get("content") is None):
+                    raise ValueError(f"Invalid change: {change}")
+            repo = await self.get_repo()
+            branch = branch or repo.default_branch
+            result = await self.run("batch_commit", self._commit_changes, repo, branch, changes, message, base_sha)
+            self.cache.drop_index(branch)
+            for change in changes:
+                path = change["path"].strip("/")
+                self.cache.invalidate(path)
+                if not change.get("delete"):
+                    self.cache.put_file(path, result["files"][path], change["content"])
+            return result
+        except Exception as e:
+            logger.error(f"Error committing changes: {str(e)}")
+            raise
+
+    def _commit_changes(self, repo, branch: str, changes: list, message: str, base_sha: str = None) -> dict:
+        from github import InputGitTreeElement
+        ref = repo.get_git_ref(f"heads/{branch}")
+        head_sha = ref.object.sha
+        if base_sha and head_sha != base_sha:
+            raise ValueError(f"{branch} has moved to {head_sha[:7]} since {base_sha[:7]}")
+        base_commit = repo.get_git_commit(head_sha)
+        index = self.cache.get_index(branch)
+        modes = {entry["path"]: entry["mode"] for entry in index["entries"]} if index else {}
+
+        elements = []
+        files = {}
+        for change in changes:
+            path = change["path"].strip("/")
+            mode = modes.get(path, "100644")
+            if change.get("delete"):
+                elements.append(InputGitTreeElement(path, mode, "blob", sha=None))
+                files[path] = None
+            else:
+                # Inline content lets GitHub create the blobs as part of the tree request
+                elements.append(InputGitTreeElement(path, mode, "blob", content=change["content"]))
+                files[path] = self.blob_sha(change["content"])
+
+        tree = repo.create_git_tree(elements, base_commit.tree)
+        commit = repo.create_git_commit(message, tree, [base_commit])
+        ref.edit(commit.sha)
+        return {"commit_sha": commit.sha, "tree_sha": tree.sha, "files": files}
+
     async def delete_file(self, path: str, sha: str, message: str) -> bool:
         try:
-            self.repo.delete_file(
+            repo = await self.get_repo()
+            await self.run(
+                "delete_file",
+                repo.delete_file,
                 path=path,
                 message=message,
                 sha=sha
             )
+            self.cache.invalidate(path.strip("/"))
             return True
         except Exception as e:
             logger.error(f"Error deleting file: {str(e)}")
@@ -74,52 +321,75 @@ class GitHubIntegration:
 
 github = GitHubIntegration()
 
-def setup_routes(app: FastAPI):
-    @app.websocket("/ws/github")
-    async def websocket_endpoint(websocket: WebSocket):
-        await websocket.accept()
-        try:
-            while True:
-                data = await websocket.receive_json()
-                try:
-                    operation = data.get('operation')
-                    if operation == 'list':
-                        files = await github.list_files(data.get('path', ''))
-                        await websocket.send_json({
-                            "type": "files",
-                            "content": files
-                        })
-                    elif operation == 'get':
-                        file = await github.get_file(data.get('path'))
-                        await websocket.send_json({
-                            "type": "file",
-                            "content": file
-                        })
-                    elif operation == 'save':
-                        result = await github.save_file(
-                            data.get('path'),
-                            data.get('content'),
-                            data.get('message', 'Update from dashboard'),
-                            data.get('sha')
-                        )
-                        await websocket.send_json({
-                            "type": "save",
-                            "content": result
-                        })
-                    elif operation == 'delete':
-                        result = await github.delete_file(
-                            data.get('path'),
-                            data.get('sha'),
-                            data.get('message', 'Delete from dashboard')
-                        )
-                        await websocket.send_json({
-                            "type": "delete",
-                            "content": {"success": result}
-                        })
-                except Exception as e:
+async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            try:
+                operation = data.get('operation')
+                if operation == 'list':
+                    files = await github.list_files(data.get('path', ''))
                     await websocket.send_json({
-                        "type": "error",
-                        "content": str(e)
+                        "type": "files",
+                        "content": files
                     })
-        except Exception as e:
-            logger.error(f"WebSocket error: {str(e)}")
+                elif operation == 'get':
+                    file = await github.get_file(data.get('path'))
+                    await websocket.send_json({
+                        "type": "file",
+                        "content": file
+                    })
+                elif operation == 'save':
+                    result = await github.save_file(
+                        data.get('path'),
+                        data.get('content'),
+                        data.get('message', 'Update from dashboard'),
+                        data.get('sha')
+                    )
+                    await websocket.send_json({
+                        "type": "save",
+                        "content": result
+                    })
+                elif operation == 'delete':
+                    result = await github.delete_file(
+                        data.get('path'),
+                        data.get('sha'),
+                        data.get('message', 'Delete from dashboard')
+                    )
+                    await websocket.send_json({
+                        "type": "delete",
+                        "content": {"success": result}
+                    })
+                elif operation == 'tree':
+                    tree = await github.get_tree(data.get('branch'))
+                    await websocket.send_json({
+                        "type": "tree",
+                        "content": tree
+                    })
+                elif operation == 'batch_commit':
+                    result = await github.batch_commit(
+                        data.get('changes', []),
+                        data.get('message', 'Update from dashboard'),
+                        data.get('branch'),
+                        data.get('base_sha')
+                    )
+                    await websocket.send_json({
+                        "type": "batch_commit",
+                        "content": result
+                    })
+                elif operation == 'cache_stats':
+                    await websocket.send_json({
+                        "type": "cache_stats",
+                        "content": github.cache.stats()
+                    })
+            except Exception as e:
+                await websocket.send_json({
+                    "type": "error",
+                    "content": str(e)
+                })
+    except Exception as e:
+        logger.error(f"WebSocket error: {str(e)}")
+
+def setup_routes(app: FastAPI):
+    app.websocket("/ws/github")(websocket_endpoint)
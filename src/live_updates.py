@@ -1,93 +1,370 @@
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 from fastapi import FastAPI, WebSocket
 import asyncio
 import os
-import json
+import re
 import logging
+import threading
+from collections import OrderedDict, deque
 from typing import Dict, Set
 from datetime import datetime
+from broadcast_hub import BroadcastHub
+from file_snapshots import SnapshotStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class CodeChangeHandler(FileSystemEventHandler):
+class ChangeAggregator:
+    """Coalesces watcher events into one batch per window.
+
+    Events for the same path inside a window are merged (created then modified is still
+    created, created then deleted is nothing, deleted then created is modified, a move
+    carries the original source path along). The first event of a window arms a timer;
+    when it fires, or once ``max_batch`` paths are pending, the batch goes to ``flush``.
+    Called from watchdog's thread, so all state is behind a lock.
+    """
+
+    def __init__(self, flush, window: float = None, max_batch: int = None, extensions=None, ignore: str = None):
+        self.flush_batch = flush
+        self.window = float(os.getenv("LIVE_UPDATES_WINDOW", "0.25")) if window is None else window
+        self.max_batch = max_batch or int(os.getenv("LIVE_UPDATES_MAX_BATCH", "500"))
+        extensions = extensions or os.getenv("LIVE_UPDATES_EXTENSIONS", ".py,.js,.html,.css").split(",")
+        self.extension_pattern = re.compile(
+            "(%s)$" % "|".join(re.escape(extension.strip()) for extension in extensions if extension.strip()))
+        self.ignore_pattern = re.compile(ignore or os.getenv(
+            "LIVE_UPDATES_IGNORE", r"(^|[\\/])(\.git|__pycache__|node_modules|site-packages)([\\/]|$)"))
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()
+        self.timer = None
+        self.events = 0
+        self.filtered = 0
+        self.batches = 0
+
+    def matches(self, path: str) -> bool:
+        return bool(path) and bool(self.extension_pattern.search(path)) and not self.ignores(path)
+
+    def ignores(self, path: str) -> bool:
+        """Whether ``path`` (a file or a directory) is inside an ignored directory."""
+        return bool(self.ignore_pattern.search(path))
+
+    def add(self, event: str, path: str, dest_path: str = None):
+        """Record a "created", "modified", "deleted" or "moved" event."""
+        with self.lock:
+            self.events += 1
+            if event == "moved":
+                self._move(path, dest_path)
+            elif self.matches(path):
+                self._merge(path, event)
+            else:
+                self.filtered += 1
+                return
+            if len(self.pending) >= self.max_batch:
+                batch = self._take()
+            else:
+                if self.timer is None and self.pending:
+                    self.timer = threading.Timer(self.window, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        self._send(batch)
+
+    def _merge(self, path: str, event: str):
+        previous = self.pending.get(path)
+        if previous is None:
+            self.pending[path] = {"event": event, "path": path}
+        elif event == "deleted":
+            del self.pending[path]
+            if previous["event"] == "moved":
+                self.pending[previous["src_path"]] = {"event": "deleted", "path": previous["src_path"]}
+            elif previous["event"] != "created":
+                self.pending[path] = {"event": "deleted", "path": path}
+        elif event == "created":
+            self.pending[path] = {"event": "modified" if previous["event"] == "deleted" else "created", "path": path}
+        elif previous["event"] == "deleted":
+            self.pending[path] = {"event": "modified", "path": path}
+        # A modification after created/modified/moved adds nothing
+
+    def _move(self, src_path: str, dest_path: str):
+        src_matches, dest_matches = self.matches(src_path), self.matches(dest_path)
+        if not src_matches and not dest_matches:
+            self.filtered += 1
+            return
+        if not dest_matches:
+            self._merge(src_path, "deleted")
+            return
+        if not src_matches:
+            self._merge(dest_path, "created")
+            return
+        previous = self.pending.pop(src_path, None)
+        if previous is not None and previous["event"] == "created":
+            self._merge(dest_path, "created")
+            return
+        origin = previous["src_path"] if previous is not None and previous["event"] == "moved" else src_path
+        self.pending[dest_path] = {"event": "moved", "path": dest_path, "src_path": origin}
+
+    def _take(self) -> list:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch = list(self.pending.values())
+        self.pending.clear()
+        if batch:
+            self.batches += 1
+        return batch
+
+    def flush(self):
+        with self.lock:
+            batch = self._take()
+        self._send(batch)
+
+    def _send(self, batch: list):
+        if not batch:
+            return
+        try:
+            self.flush_batch(batch)
+        except Exception as e:
+            logger.error(f"Error flushing file changes: {str(e)}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "pending": len(self.pending),
+                "events": self.events,
+                "filtered": self.filtered,
+                "batches": self.batches
+            }
+
+
+class EventBridge:
+    """Hands callbacks from watcher threads to the server's running event loop.
+
+    Until a loop is attached (or after it goes away) callbacks are held in a backlog and
+    delivered in order on the next ``attach``, so nothing the watcher saw is lost.
+    """
+
+    def __init__(self, max_backlog: int = None):
+        self.loop = None
+        self.lock = threading.Lock()
+        self.backlog = deque(maxlen=max_backlog or int(os.getenv("LIVE_UPDATES_MAX_BACKLOG", "1000")))
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        with self.lock:
+            self.loop = loop
+            while self.backlog:
+                callback, args = self.backlog.popleft()
+                loop.call_soon_threadsafe(callback, *args)
+
+    def detach(self):
+        with self.lock:
+            self.loop = None
+
+    def submit(self, callback, *args):
+        """Schedule ``callback(*args)`` on the loop; safe to call from any thread."""
+        with self.lock:
+            if self.loop is not None:
+                try:
+                    self.loop.call_soon_threadsafe(callback, *args)
+                    return
+                except RuntimeError:
+                    # The loop was closed under us
+                    self.loop = None
+            if len(self.backlog) == self.backlog.maxlen:
+                logger.warning("Live update backlog is full; dropping the oldest change batch")
+            self.backlog.append((callback, args))
+
+
+class CodeChangeHandler:
+    """Watchdog event handler.
+
+    Watchdog only needs a ``dispatch`` method, so this does not subclass
+    FileSystemEventHandler and watchdog is not imported until watching starts.
+    """
+
     def __init__(self, live_updates):
         self.live_updates = live_updates
-        self.last_event_time = {}
-        self.debounce_seconds = 1.0
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
+        self.aggregator = ChangeAggregator(self.send_batch)
+
+    def dispatch(self, event):
+        handler = getattr(self, f"on_{event.event_type}", None)
+        if handler is not None:
+            handler(event)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.aggregator.add("created", event.src_path)
 
     def on_modified(self, event):
-        if event.is_directory:
+        if not event.is_directory:
+            self.aggregator.add("modified", event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.aggregator.add("deleted", event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.aggregator.add("moved", event.src_path, event.dest_path)
+
+    def send_batch(self, changes: list):
+        # Runs on the aggregator's timer thread, so reading and diffing stay off the loop
+        changes = [change for change in map(self.live_updates.snapshots.annotate, changes) if change]
+        if not changes:
             return
-        
-        current_time = datetime.now()
-        last_time = self.last_event_time.get(event.src_path)
-        
-        if last_time is None or (current_time - last_time).total_seconds() > self.debounce_seconds:
-            self.last_event_time[event.src_path] = current_time
-            if event.src_path.endswith(('.py', '.js', '.html', '.css')):
-                asyncio.run_coroutine_threadsafe(
-                    self.live_updates.broadcast_change({
-                        'type': 'file_changed',
-                        'path': event.src_path,
-                        'timestamp': current_time.isoformat()
-                    }),
-                    self.loop
-                )
+        # Clients know files by their workspace path (as /api/files lists them), not the watcher's
+        self.live_updates.bridge.submit(self.live_updates.dispatch, changes, {
+            'type': 'files_changed',
+            'changes': [self.live_updates.publishable(change) for change in changes],
+            'timestamp': datetime.now().isoformat()
+        })
 
 class LiveUpdates:
     def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+        self.hub = BroadcastHub()
         self.connection_counter = 0
         self.watched_paths: Set[str] = set()
-        self.observer = Observer()
+        self.observer = None
+        self.bridge = EventBridge()
+        self.snapshots = SnapshotStore()
+        self.listeners = []
+        self.relative = lambda path: os.path.relpath(path).replace(os.sep, "/")
         self.event_handler = CodeChangeHandler(self)
-        
+        self.backend = os.getenv("LIVE_UPDATES_OBSERVER", "auto")
+        self.poll_interval = float(os.getenv("LIVE_UPDATES_POLL_INTERVAL", "1.0"))
+
+    def _make_observer(self, polling: bool):
+        if polling:
+            from watchdog.observers.polling import PollingObserver
+            return PollingObserver(timeout=self.poll_interval)
+        from watchdog.observers import Observer
+        return Observer()
+
+    def _is_polling(self) -> bool:
+        return type(self.observer).__name__ == "PollingObserver"
+
+    def _use_polling(self, error: OSError):
+        # inotify missing, out of watches, or a filesystem that does not report events
+        if self.backend != "auto" or self._is_polling():
+            raise error
+        logger.warning(f"Native file watching unavailable ({str(error)}); falling back to polling")
+        was_running = self.observer.is_alive()
+        if was_running:
+            self.observer.stop()
+        self.observer = self._make_observer(polling=True)
+        for path in self.watched_paths:
+            self.observer.schedule(self.event_handler, path, recursive=True)
+        if was_running:
+            self.observer.start()
+
+    def _schedule(self, path: str):
+        try:
+            self.observer.schedule(self.event_handler, path, recursive=True)
+        except OSError as e:
+            self._use_polling(e)
+
+    def start(self, loop: asyncio.AbstractEventLoop, paths=()):
+        """Attach to the server loop and start the observer; called from the app lifespan."""
+        self.bridge.attach(loop)
+        if self.observer is None:
+            self.observer = self._make_observer(polling=self.backend == "polling")
+            for path in list(self.watched_paths):
+                self._schedule(path)
+        for path in paths:
+            self.start_watching(path)
+        if not self.observer.is_alive():
+            try:
+                self.observer.start()
+            except OSError as e:
+                self._use_polling(e)
+                self.observer.start()
+            logger.info(f"Started watching with {type(self.observer).__name__}: {sorted(self.watched_paths)}")
+            # After the observer starts, so a file changed meanwhile is recorded by its event
+            threading.Thread(target=self.seed_snapshots, args=(sorted(self.watched_paths),),
+                             name="snapshot-seed", daemon=True).start()
+
+    def seed_snapshots(self, paths):
+        """Snapshot the watched files as they are now, so later changes are reported as deltas."""
+        aggregator = self.event_handler.aggregator
+        for top in paths:
+            for root, dirs, files in os.walk(top):
+                dirs[:] = [name for name in dirs if not aggregator.ignores(os.path.join(root, name))]
+                for name in files:
+                    path = os.path.join(root, name)
+                    if aggregator.matches(path):
+                        self.snapshots.seed(path)
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+        self.event_handler.aggregator.flush()
+        self.bridge.detach()
+
     def start_watching(self, path: str):
         if path not in self.watched_paths:
-            self.observer.schedule(self.event_handler, path, recursive=True)
             self.watched_paths.add(path)
-            if not self.observer.is_alive():
-                self.observer.start()
-                logger.info(f"Started watching directory: {path}")
+            if self.observer is not None:
+                self._schedule(path)
+            logger.info(f"Watching directory: {path}")
+
+    @property
+    def active_connections(self) -> Dict[int, WebSocket]:
+        return {connection_id: channel.websocket for connection_id, channel in self.hub.clients.items()}
 
     async def connect(self, websocket: WebSocket) -> int:
         await websocket.accept()
         self.connection_counter += 1
-        self.active_connections[self.connection_counter] = websocket
+        self.hub.add(self.connection_counter, websocket)
         return self.connection_counter
 
     def disconnect(self, connection_id: int):
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
+        self.hub.remove(connection_id)
 
-    async def broadcast_change(self, data: dict):
-        disconnected = []
-        for connection_id, websocket in self.active_connections.items():
+    def add_listener(self, callback):
+        """Call ``callback(changes)`` on the server loop for every batch of file changes."""
+        self.listeners.append(callback)
+
+    def publishable(self, change: dict) -> dict:
+        """``change`` with its paths made workspace-relative through ``relative``.
+
+        Paths outside the workspace (a watched directory elsewhere) are sent as they are.
+        """
+        change = dict(change, path=self.relative(change["path"]) or change["path"])
+        if "src_path" in change:
+            change["src_path"] = self.relative(change["src_path"]) or change["src_path"]
+        return change
+
+    def dispatch(self, changes: list, message: dict):
+        for listener in self.listeners:
             try:
-                await websocket.send_json(data)
+                listener(changes)
             except Exception as e:
-                logger.error(f"Error sending to websocket {connection_id}: {e}")
-                disconnected.append(connection_id)
-        
-        for connection_id in disconnected:
-            self.disconnect(connection_id)
+                logger.error(f"Error in file change listener: {str(e)}")
+        self.hub.publish(message)
+
+    async def broadcast_change(self, data: dict):
+        # Queues the frame for every client and returns; each client's writer sends it
+        self.hub.publish(data)
 
 # Initialize live updates
 live_updates = LiveUpdates()
 
+async def websocket_endpoint(websocket: WebSocket):
+    connection_id = await live_updates.connect(websocket)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            # Replies go through the client's queue so they never interleave with broadcasts
+            if data == "stats":
+                live_updates.hub.send(connection_id, {
+                    "type": "stats",
+                    "content": dict(live_updates.hub.stats(), snapshots=live_updates.snapshots.stats())
+                })
+            else:
+                live_updates.hub.send(connection_id, {"status": "received"})
+    except Exception as e:
+        logger.error(f"WebSocket error: {str(e)}")
+    finally:
+        live_updates.disconnect(connection_id)
+
 def setup_routes(app: FastAPI):
-    @app.websocket("/ws/updates")
-    async def websocket_endpoint(websocket: WebSocket):
-        connection_id = await live_updates.connect(websocket)
-        try:
-            while True:
-                data = await websocket.receive_text()
-                await websocket.send_json({"status": "received"})
-        except Exception as e:
-            logger.error(f"WebSocket error: {str(e)}")
-        finally:
-            live_updates.disconnect(connection_id)
+    app.websocket("/ws/updates")(websocket_endpoint)
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PromptCache:
+    """Two-tier cache of generated code keyed by normalized (prompt, model, temperature).
+
+    An in-memory LRU sits in front of an append-only JSON-lines file. The file is indexed
+    by byte offset on startup, so a memory miss costs one seek and one line read. Entries
+    expire after ``ttl`` seconds; the file is compacted once it grows past ``max_disk_bytes``
+    or has more dead lines than live ones.
+    """
+
+    def __init__(self, path: str = None, memory_size: int = None, ttl: float = None,
+                 max_disk_bytes: int = None):
+        self.path = path or os.getenv("LLM_CACHE_PATH", os.path.join("cache", "llm_cache.jsonl"))
+        self.memory_size = memory_size or int(os.getenv("LLM_CACHE_MEMORY_SIZE", "256"))
+        self.ttl = float(os.getenv("LLM_CACHE_TTL", "86400")) if ttl is None else ttl
+        self.max_disk_bytes = max_disk_bytes or int(os.getenv("LLM_CACHE_MAX_DISK_BYTES", str(50 * 1024 * 1024)))
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+        self._memory = OrderedDict()
+        self._index = {}
+        self._dead_lines = 0
+        self._file_lock = threading.Lock()
+        self._loaded = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        return re.sub(r'\s+', ' ', prompt).strip()
+
+    def key(self, prompt: str, model: str, temperature: float) -> str:
+        raw = json.dumps([self.normalize_prompt(prompt), model, round(float(temperature), 3)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: dict) -> bool:
+        return bool(self.ttl) and time.time() - entry["created"] > self.ttl
+
+    async def get(self, prompt: str, model: str, temperature: float):
+        """Return the cached code for this request, or None."""
+        if not self.enabled:
+            return None
+        key = self.key(prompt, model, temperature)
+        entry = self._memory.get(key)
+        if entry is not None and not self._expired(entry):
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry["code"]
+        if entry is not None:
+            del self._memory[key]
+
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, entry)
+        return entry["code"]
+
+    async def put(self, prompt: str, model: str, temperature: float, code: str):
+        if not self.enabled:
+            return
+        key = self.key(prompt, model, temperature)
+        entry = {"key": key, "created": time.time(), "model": model, "code": code}
+        self._remember(key, entry)
+        await asyncio.to_thread(self._append_disk, entry)
+
+    def _remember(self, key: str, entry: dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _load_index(self):
+        """Scan the store once, remembering the offset of the newest line for each key."""
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                    self._index[entry["key"]] = (offset, entry["created"])
+                except (ValueError, KeyError):
+                    pass
+                offset += len(line)
+        self._dead_lines = lines - len(self._index)
+
+    def _read_disk(self, key: str):
+        with self._file_lock:
+            if not self._loaded:
+                self._load_index()
+            location = self._index.get(key)
+            if location is None:
+                return None
+            offset, created = location
+            if self.ttl and time.time() - created > self.ttl:
+                del self._index[key]
+                self._dead_lines += 1
+                return None
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+
+    def _append_disk(self, entry: dict):
+        with self._file_lock:
+            if not self._loaded:
+                self._load_index()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(json.dumps(entry).encode("utf-8") + b"\n")
+                size = f.tell()
+            if entry["key"] in self._index:
+                self._dead_lines += 1
+            self._index[entry["key"]] = (offset, entry["created"])
+            if size > self.max_disk_bytes or self._dead_lines > len(self._index):
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the store with live entries only, newest first, within the size budget."""
+        now = time.time()
+        live = sorted(
+            ((key, offset, created) for key, (offset, created) in self._index.items()
+             if not self.ttl or now - created <= self.ttl),
+            key=lambda item: item[2], reverse=True)
+        budget = self.max_disk_bytes // 2
+        kept = []
+        with open(self.path, "rb") as f:
+            for key, offset, created in live:
+                f.seek(offset)
+                line = f.readline()
+                if budget - len(line) < 0:
+                    break
+                budget -= len(line)
+                kept.append((key, created, line))
+
+        tmp_path = self.path + ".tmp"
+        index = {}
+        with open(tmp_path, "wb") as f:
+            for key, created, line in reversed(kept):
+                index[key] = (f.tell(), created)
+                f.write(line)
+        os.replace(tmp_path, self.path)
+        self.disk_evictions += len(self._index) - len(index)
+        self._index = index
+        self._dead_lines = 0
+        logger.info(f"Compacted LLM cache to {len(index)} entries")
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._index),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
@@ -1,21 +1,45 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from anthropic import AsyncAnthropic
+import asyncio
 import os
+import time
+import uuid
 import logging
+from collections import deque
 from code_executor import code_executor  # Import the code_executor
+from llm_cache import PromptCache
+from llm_scheduler import FairScheduler, SingleFlight, retry_with_backoff, is_rate_limit_error
+from metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+generation_seconds = metrics.histogram("llm_generation_seconds", "End-to-end code generation time")
+first_token_seconds = metrics.histogram("llm_first_token_seconds", "Time until the first generated text")
+generation_errors = metrics.counter("llm_generation_errors_total", "Code generations that failed")
+
 class LLMIntegration:
-    def __init__(self):
+    def __init__(self, client=None, cache: PromptCache = None):
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not self.api_key:
+        self.model = os.getenv("LLM_MODEL", "claude-3-sonnet-20240229")
+        self.max_tokens = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+        self.temperature = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+        # A client passed in is e.g. a local fake implementing messages.create / messages.stream
+        self._client = client
+        if client is None and not self.api_key:
             logger.error("ANTHROPIC_API_KEY not found in environment variables")
-            self.anthropic = None
-        else:
-            self.anthropic = AsyncAnthropic(api_key=self.api_key)
+        self.cache = cache if cache is not None else PromptCache()
+        self.scheduler = FairScheduler()
+        self.flights = SingleFlight()
         self.connections = []
+        self.latencies = deque(maxlen=int(os.getenv("LLM_LATENCY_HISTORY", "100")))
+
+    @property
+    def anthropic(self):
+        """The SDK client; the anthropic package is only imported on first use."""
+        if self._client is None and self.api_key:
+            from anthropic import AsyncAnthropic
+            self._client = AsyncAnthropic(api_key=self.api_key)
+        return self._client
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -26,51 +50,345 @@ class LLMIntegration:
         self.connections.remove(websocket)
         logger.info("LLM WebSocket disconnected")
 
-    async def generate_code(self, prompt: str) -> str: 
+    def build_messages(self, prompt: str) -> list:
+        return [{
+            "role": "user",
+            "content": f"Generate Python code for: {prompt}. Code should be complete, runnable, and include example usage."
+        }]
+
+    async def generate_code(self, prompt: str, on_delta=None, use_cache: bool = True, owner=None) -> str:
+        """Generate code for ``prompt``; see ``generate_code_with_latency``."""
+        code, _ = await self.generate_code_with_latency(prompt, on_delta, use_cache, owner)
+        return code
+
+    async def generate_code_with_latency(self, prompt: str, on_delta=None, use_cache: bool = True,
+                                        owner=None) -> tuple:
+        """Generate code for ``prompt``, returning it with this call's latency entry.
+
+        With ``on_delta``, the response is streamed and each text delta is awaited as
+        ``on_delta(text)`` as soon as it arrives. Cancelling the calling task aborts the
+        upstream request. Identical earlier prompts are answered from the cache unless
+        ``use_cache`` is False, and identical prompts already in flight share one upstream
+        call. Upstream calls are limited by a scheduler that is fair across ``owner``s.
+        """
         try:
+            start_time = time.perf_counter()
+            if use_cache:
+                cached = await self.cache.get(prompt, self.model, self.temperature)
+                if cached is not None:
+                    if on_delta is not None:
+                        await on_delta(cached)
+                    latency = self.record_latency(None, time.perf_counter() - start_time,
+                                                  streamed=on_delta is not None, cached=True)
+                    return cached, latency
             if not self.anthropic:
                 raise ValueError("Anthropic client not initialized")
-            response = await self.anthropic.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1024,
-                temperature=0.7,
-                messages=[{
-                    "role": "user",
-                    "content": f"Generate Python code for: {prompt}. Code should be complete, runnable, and include example usage."
-                }]
-            )
-            return response.content[0].text.strip()
+
+            first_token = None
+            forward = None
+            if on_delta is not None:
+                async def forward(text):
+                    nonlocal first_token
+                    if first_token is None:
+                        first_token = time.perf_counter() - start_time
+                    await on_delta(text)
+
+            async def produce(emit):
+                async with self.scheduler.slot(owner):
+                    code = await self._request_with_retry(prompt, emit if on_delta is not None else None)
+                if use_cache:
+                    await self.cache.put(prompt, self.model, self.temperature, code)
+                return code
+
+            key = self.cache.key(prompt, self.model, self.temperature)
+            code = await self.flights.run(key, produce, forward)
+            if forward is not None and first_token is None:
+                # Joined a non-streaming call in flight; deliver the result in one piece
+                await forward(code)
+            latency = self.record_latency(first_token, time.perf_counter() - start_time,
+                                          streamed=on_delta is not None)
+            return code, latency
         except Exception as e:
+            generation_errors.inc(error=type(e).__name__)
             logger.error(f"Error in code generation: {str(e)}")
             raise
 
+    async def _request_with_retry(self, prompt: str, emit=None) -> str:
+        emitted = False
+
+        async def tracked_emit(text):
+            nonlocal emitted
+            emitted = True
+            await emit(text)
+
+        return await retry_with_backoff(
+            lambda: self._request(prompt, tracked_emit if emit is not None else None),
+            # Once part of a stream reached the client, a retry would repeat it
+            is_retryable=lambda e: not emitted and is_rate_limit_error(e)
+        )
+
+    async def _request(self, prompt: str, emit=None) -> str:
+        """Make one upstream call, streaming deltas through ``emit`` when given."""
+        if emit is None:
+            response = await self.anthropic.messages.create(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                messages=self.build_messages(prompt)
+            )
+            return response.content[0].text.strip()
+        parts = []
+        async with self.anthropic.messages.stream(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            messages=self.build_messages(prompt)
+        ) as stream:
+            async for text in stream.text_stream:
+                parts.append(text)
+                await emit(text)
+        return ''.join(parts).strip()
+
+    def record_latency(self, first_token: float, total: float, streamed: bool, cached: bool = False) -> dict:
+        """Add one call's timings to the history and metrics, and return its entry."""
+        entry = {
+            "first_token": round(first_token if first_token is not None else total, 4),
+            "total": round(total, 4),
+            "streamed": streamed,
+            "cached": cached
+        }
+        self.latencies.append(entry)
+        source = "cache" if cached else "upstream"
+        generation_seconds.observe(total, source=source, streamed=str(streamed).lower())
+        first_token_seconds.observe(entry["first_token"], source=source)
+        logger.info(f"Code generation took {entry['total']:.3f}s (first token after {entry['first_token']:.3f}s)")
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "cache": self.cache.stats(),
+            "scheduler": self.scheduler.stats(),
+            "coalescing": self.flights.stats(),
+            "latency": self.latency_stats()
+        }
+
+    def latency_stats(self) -> dict:
+        if not self.latencies:
+            return {"count": 0}
+        first = sorted(e["first_token"] for e in self.latencies)
+        total = sorted(e["total"] for e in self.latencies)
+        return {
+            "count": len(self.latencies),
+            "first_token_p50": first[len(first) // 2],
+            "total_p50": total[len(total) // 2],
+            "last": self.latencies[-1]
+        }
+
 llm = LLMIntegration() 
 
+async def send_quietly(websocket: WebSocket, data: dict):
+    """Send a status message, ignoring a socket that has already gone away."""
+    try:
+        await websocket.send_json(data)
+    except Exception:
+        pass
+
+
+class GenerationPipeline:
+    """Per-connection generate -> execute pipeline.
+
+    Prompts wait in a bounded generate queue; generated code waits in a bounded execute
+    queue. The two stages run as separate tasks, so prompt N+1 is being generated while
+    the code for prompt N executes. A full execute queue holds the generate stage back.
+    """
+
+    def __init__(self, websocket: WebSocket, generate_depth: int = None, execute_depth: int = None):
+        self.websocket = websocket
+        self.generate_queue = asyncio.Queue(
+            maxsize=generate_depth or int(os.getenv("LLM_PIPELINE_GENERATE_DEPTH", "8")))
+        self.execute_queue = asyncio.Queue(
+            maxsize=execute_depth or int(os.getenv("LLM_PIPELINE_EXECUTE_DEPTH", "2")))
+        self.queued = set()
+        self.cancelled = set()
+        self.generating = {}
+        self.executing = None
+        self._stages = [
+            asyncio.ensure_future(self._generate_stage()),
+            asyncio.ensure_future(self._execute_stage())
+        ]
+
+    async def status(self, request_id: str, stage: str, **extra):
+        await send_quietly(self.websocket, {
+            "type": "pipeline_status",
+            "request_id": request_id,
+            "stage": stage,
+            "generate_queue": self.generate_queue.qsize(),
+            "execute_queue": self.execute_queue.qsize(),
+            **extra
+        })
+
+    async def submit(self, request_id: str, prompt: str, stream: bool = False,
+                     use_cache: bool = True, execute: bool = True) -> bool:
+        try:
+            self.generate_queue.put_nowait((request_id, prompt, stream, use_cache, execute))
+        except asyncio.QueueFull:
+            return False
+        self.queued.add(request_id)
+        await self.status(request_id, "queued")
+        return True
+
+    def cancel(self, request_id: str = None) -> bool:
+        """Cancel one request wherever it is in the pipeline, or all of them without an id."""
+        if request_id is None:
+            ids = set(self.queued) | set(self.generating)
+            if self.executing:
+                ids.add(self.executing)
+            return any([self.cancel(rid) for rid in ids])
+        if request_id in self.generating:
+            self.cancelled.add(request_id)
+            self.generating[request_id].cancel()
+            return True
+        if request_id == self.executing:
+            return code_executor.cancel(self.websocket, request_id)
+        if request_id in self.queued:
+            self.cancelled.add(request_id)
+            return True
+        return False
+
+    async def _skip_if_cancelled(self, request_id: str) -> bool:
+        if request_id not in self.cancelled:
+            return False
+        self.cancelled.discard(request_id)
+        self.queued.discard(request_id)
+        await send_quietly(self.websocket, {"type": "generation_cancelled", "request_id": request_id})
+        await self.status(request_id, "cancelled")
+        return True
+
+    async def _generate_stage(self):
+        while True:
+            request_id, prompt, stream, use_cache, execute = await self.generate_queue.get()
+            if await self._skip_if_cancelled(request_id):
+                continue
+            await self.status(request_id, "generating")
+            task = asyncio.ensure_future(self._generate(request_id, prompt, stream, use_cache))
+            self.generating[request_id] = task
+            try:
+                code, latency = await task
+            except asyncio.CancelledError:
+                if request_id not in self.cancelled:
+                    raise
+                await self._skip_if_cancelled(request_id)
+                continue
+            except Exception as e:
+                self.queued.discard(request_id)
+                await send_quietly(self.websocket, {
+                    "type": "error",
+                    "request_id": request_id,
+                    "error": str(e)
+                })
+                await self.status(request_id, "failed", error=str(e))
+                continue
+            finally:
+                self.generating.pop(request_id, None)
+
+            # Send the generated code back to the frontend
+            await send_quietly(self.websocket, {
+                "type": "code_generated",
+                "request_id": request_id,
+                "code": code,
+                "latency": latency
+            })
+            if not execute:
+                self.queued.discard(request_id)
+                await self.status(request_id, "done")
+                continue
+            if self.execute_queue.full():
+                await self.status(request_id, "waiting_for_executor")
+            await self.execute_queue.put((request_id, code))
+            await self.status(request_id, "generated")
+
+    async def _generate(self, request_id: str, prompt: str, stream: bool, use_cache: bool) -> tuple:
+        on_delta = None
+        if stream:
+            async def on_delta(text):
+                await self.websocket.send_json({
+                    "type": "code_delta",
+                    "request_id": request_id,
+                    "delta": text
+                })
+        return await llm.generate_code_with_latency(prompt, on_delta=on_delta, use_cache=use_cache,
+                                                    owner=id(self.websocket))
+
+    async def _execute_stage(self):
+        while True:
+            request_id, code = await self.execute_queue.get()
+            if await self._skip_if_cancelled(request_id):
+                continue
+            self.queued.discard(request_id)
+            self.executing = request_id
+            await self.status(request_id, "executing")
+            try:
+                # Trigger code execution on the backend
+                result = await code_executor.execute_code(self.websocket, code, job_id=request_id)
+                await self.status(request_id, "done", result=result.get("status"),
+                                  error=result.get("error"))
+            except Exception as e:
+                await self.status(request_id, "failed", error=str(e))
+            finally:
+                self.executing = None
+
+    async def close(self):
+        self.cancel()
+        for task in self._stages:
+            task.cancel()
+        await asyncio.gather(*self._stages, return_exceptions=True)
+
+
 async def websocket_endpoint(websocket: WebSocket):
     await llm.connect(websocket)
+    pipeline = GenerationPipeline(websocket)
     try:
         while True:
             data = await websocket.receive_json()
             if data.get('type') == 'generate_code':
-                prompt = data.get('prompt', '')
-                
-                # Generate code
-                code = await llm.generate_code(prompt)  
-                
-                # Send the generated code back to the frontend
+                request_id = data.get('request_id') or uuid.uuid4().hex
+                accepted = await pipeline.submit(
+                    request_id,
+                    data.get('prompt', ''),
+                    stream=bool(data.get('stream')),
+                    use_cache=data.get('cache', True) is not False,
+                    execute=data.get('execute', True) is not False
+                )
+                if not accepted:
+                    await websocket.send_json({
+                        "type": "error",
+                        "request_id": request_id,
+                        "error": "Too many prompts queued on this connection"
+                    })
+            elif data.get('type') == 'cache_stats':
                 await websocket.send_json({
-                    "type": "code_generated",  
-                    "code": code
+                    "type": "cache_stats",
+                    "content": llm.cache.stats()
                 })
-                
-                # Trigger code execution on the backend
-                await code_executor.execute_code(websocket, code)  
+            elif data.get('type') == 'stats':
+                await websocket.send_json({
+                    "type": "stats",
+                    "content": llm.stats()
+                })
+            elif data.get('type') == 'input':
+                # Generated code that calls input() waits on the execute stage for this
+                code_executor.provide_input(websocket, data.get('value', ''), data.get('job_id'))
+            elif data.get('type') == 'cancel_generation':
+                # Without an id, cancel everything in flight on this connection
+                pipeline.cancel(data.get('request_id'))
 
     except WebSocketDisconnect:
-        await llm.disconnect(websocket)  
+        await llm.disconnect(websocket)
     except Exception as e:
         logger.error(f"LLM WebSocket error: {str(e)}")
         await websocket.send_json({
             "type": "error",
             "error": str(e)
-        })
\ No newline at end of file
+        })
+    finally:
+        await pipeline.close()
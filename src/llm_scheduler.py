@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import logging
+import os
+import random
+from collections import OrderedDict, deque
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FairScheduler:
+    """Bounded-concurrency gate that hands free slots to waiting owners round-robin.
+
+    Each owner (typically a WebSocket connection) has its own FIFO of waiters, so one
+    connection sending a burst of prompts cannot starve the others.
+    """
+
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        self.active = 0
+        self._waiting = OrderedDict()
+
+    async def acquire(self, owner=None):
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(owner, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just as we were cancelled
+                self.release()
+            else:
+                queue = self._waiting.get(owner)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiting[owner]
+            raise
+
+    def release(self):
+        """Pass the slot straight to the next owner in line, or free it."""
+        while self._waiting:
+            owner, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            # Move this owner to the back of the rotation
+            del self._waiting[owner]
+            if queue:
+                self._waiting[owner] = queue
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, owner=None):
+        await self.acquire(owner)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "waiting": sum(len(queue) for queue in self._waiting.values()),
+            "waiting_owners": len(self._waiting)
+        }
+
+
+class Flight:
+    """One upstream call shared by every caller that asked for the same key."""
+
+    def __init__(self):
+        self.deltas = []
+        self.subscribers = set()
+        self.waiters = 0
+        self.task = None
+
+    async def emit(self, text: str):
+        self.deltas.append(text)
+        for subscriber in list(self.subscribers):
+            try:
+                await subscriber(text)
+            except Exception as e:
+                logger.error(f"Error forwarding delta to a coalesced caller: {str(e)}")
+                self.subscribers.discard(subscriber)
+
+    async def join(self, on_delta):
+        """Replay the deltas produced so far, then receive new ones as they arrive."""
+        sent = 0
+        while sent < len(self.deltas):
+            await on_delta(self.deltas[sent])
+            sent += 1
+        self.subscribers.add(on_delta)
+
+
+class SingleFlight:
+    """Deduplicates identical in-flight requests so they share one upstream call.
+
+    The call runs in its own task and is only cancelled once every caller waiting on it
+    has gone away.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, factory, on_delta=None):
+        """Await ``factory(emit)`` for ``key``, joining a matching call already in flight."""
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self.flights[key] = flight
+            flight.task = asyncio.ensure_future(factory(flight.emit))
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            if on_delta is not None:
+                await flight.join(on_delta)
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            flight.subscribers.discard(on_delta)
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _finish(self, key: str, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self.flights),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an upstream error means "slow down" (429) or "overloaded" (529)."""
+    status = getattr(error, "status_code", None)
+    return status in (429, 529) or type(error).__name__ in ("RateLimitError", "OverloadedError")
+
+
+def _retry_after(error: Exception):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def retry_with_backoff(call, is_retryable=is_rate_limit_error, attempts: int = None,
+                             base_delay: float = None, max_delay: float = None):
+    """Await ``call()``, retrying retryable errors with full-jitter exponential backoff."""
+    attempts = attempts or int(os.getenv("LLM_RETRY_ATTEMPTS", "4"))
+    base_delay = base_delay or float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    max_delay = max_delay or float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, max_delay))
+            logger.info(f"Upstream rate limited ({str(e)}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,275 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+import math
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, registry, name: str, help_text: str):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        """(suffix, label key, value) triples for the Prometheus exposition."""
+        with self.lock:
+            return [("", key, value) for key, value in self.values.items()]
+
+    def to_dict(self) -> dict:
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "samples": [{"labels": dict(key), "value": value} for _, key, value in self.samples()]
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, registry, name: str, help_text: str, callback=None, label: str = "state"):
+        super().__init__(registry, name, help_text)
+        self.callback = callback
+        self.label = label
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {str(e)}")
+            return []
+        # A callback may return one number, or {label value: number} for one series per value
+        if isinstance(value, dict):
+            return [("", ((self.label, str(state)),), number) for state, number in value.items()]
+        return [("", (), value)]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                out.append(("_bucket", key + (("le", _format_value(bound)),), cumulative))
+            out.append(("_sum", key, total))
+            out.append(("_count", key, count))
+        return out
+
+    def quantile(self, counts: list, count: int, fraction: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls in."""
+        if not count:
+            return 0.0
+        rank = fraction * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound
+        return lower
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "samples": [{
+                "labels": dict(key),
+                "count": count,
+                "sum": round(total, 6),
+                "avg": round(total / count, 6) if count else 0.0,
+                "p50": round(self.quantile(counts, count, 0.50), 6),
+                "p95": round(self.quantile(counts, count, 0.95), 6),
+                "p99": round(self.quantile(counts, count, 0.99), 6)
+            } for key, counts, total, count in series]
+        }
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms.
+
+    With ``METRICS_ENABLED=false`` every recording call returns after one attribute
+    check and ``time`` hands back a shared no-op context manager.
+    """
+
+    def __init__(self, enabled: bool = None):
+        if enabled is None:
+            enabled = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    metric = self.metrics[name] = cls(self, name, help_text, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = "", callback=None, label: str = "state") -> Gauge:
+        """A gauge that is set directly, or read from ``callback()`` at scrape time."""
+        return self._get(Gauge, name, help_text, callback=callback, label=label)
+
+    def histogram(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def time(self, name: str, help_text: str = "", **labels):
+        """``with metrics.time("x_seconds", stage="compile"):`` observes the block's duration."""
+        if not self.enabled:
+            return _null_timer
+        return self.histogram(name, help_text).time(**labels)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for suffix, key, value in metric.samples():
+                lines.append(f"{name}{suffix}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "timestamp": time.time(),
+            "metrics": {name: metric.to_dict() for name, metric in sorted(self.metrics.items())}
+        }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a short sleep.
+
+    Any lateness is time some callback held the loop, so the total is reported as
+    event-loop blocking time.
+    """
+
+    def __init__(self, registry: MetricsRegistry, interval: float = None):
+        self.registry = registry
+        self.interval = interval or float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.1"))
+        self.lag = registry.histogram("event_loop_lag_seconds", "How late the event loop woke from a timed sleep")
+        self.blocked = registry.counter("event_loop_blocked_seconds_total", "Total time the event loop was blocked")
+        self.task = None
+
+    def start(self):
+        if self.registry.enabled and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - before - self.interval)
+            self.lag.observe(lag)
+            if lag:
+                self.blocked.inc(lag)
+
+
+metrics = MetricsRegistry()
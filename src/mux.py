@@ -0,0 +1,250 @@
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import asyncio
+import json
+import logging
+from metrics import metrics
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+mux_bytes_total = metrics.counter("mux_bytes_total", "Bytes on multiplexed WebSockets by direction and codec")
+mux_streams_total = metrics.counter("mux_streams_total", "Streams opened on multiplexed WebSockets by service")
+
+# A stream closed by the client; receive_* raises WebSocketDisconnect once it is reached
+_CLOSED = object()
+
+
+class JsonCodec:
+    subprotocol = "mux.json"
+
+    def encode(self, frame: dict) -> str:
+        return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+    def encode_text(self, stream_id: int, text: str) -> str:
+        # ``text`` is already JSON (e.g. a broadcast serialized once for every client), so splice it in
+        return '{"s":%d,"t":"data","d":%s}' % (stream_id, text)
+
+
+class MsgpackCodec:
+    subprotocol = "mux.msgpack"
+
+    def encode(self, frame: dict) -> bytes:
+        return msgpack.packb(frame, use_bin_type=True)
+
+    def encode_text(self, stream_id: int, text: str) -> bytes:
+        # Pre-serialized JSON travels as a string under "j" rather than being decoded and re-packed
+        return msgpack.packb({"s": stream_id, "t": "data", "j": text}, use_bin_type=True)
+
+
+def decode_frame(data) -> dict:
+    if isinstance(data, (bytes, bytearray)):
+        if msgpack is None:
+            raise ValueError("Binary frames need the msgpack package")
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+class StreamSocket:
+    """One stream of a multiplexed connection, presented to a service as its own WebSocket.
+
+    It implements the part of the WebSocket interface the service endpoints use, so
+    ``code_executor.websocket_endpoint`` and friends run unchanged on top of it.
+    """
+
+    def __init__(self, connection, stream_id: int, service: str, query: dict):
+        self.connection = connection
+        self.stream_id = stream_id
+        self.service = service
+        self.query_params = {str(key): str(value) for key, value in (query or {}).items()}
+        self.inbox = asyncio.Queue()
+        self.closed = False
+
+    async def accept(self, subprotocol: str = None):
+        await self.connection.send({"s": self.stream_id, "t": "open"})
+
+    async def _receive(self):
+        data = await self.inbox.get()
+        if data is _CLOSED:
+            self.inbox.put_nowait(_CLOSED)
+            raise WebSocketDisconnect(1000)
+        return data
+
+    async def receive_json(self):
+        data = await self._receive()
+        return json.loads(data) if isinstance(data, str) else data
+
+    async def receive_text(self) -> str:
+        data = await self._receive()
+        return data if isinstance(data, str) else json.dumps(data)
+
+    async def send_json(self, data):
+        self._check_open()
+        await self.connection.send({"s": self.stream_id, "t": "data", "d": data})
+
+    async def send_text(self, text: str):
+        self._check_open()
+        await self.connection.write(self.connection.codec.encode_text(self.stream_id, text))
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.disconnect()
+        await self.connection.send({"s": self.stream_id, "t": "close", "code": code})
+
+    def _check_open(self):
+        # The client closed the stream; handlers treat this like a dropped connection
+        if self.closed:
+            raise WebSocketDisconnect(1000)
+
+    def disconnect(self):
+        """Mark the stream closed and wake its handler with a WebSocketDisconnect."""
+        if not self.closed:
+            self.closed = True
+            self.inbox.put_nowait(_CLOSED)
+
+
+class MuxConnection:
+    """Routes the frames of one multiplexed WebSocket to per-stream service handlers.
+
+    Frames are ``{"s": stream_id, "t": "open" | "data" | "close", ...}``. An "open" frame
+    names the service in ``svc`` and may carry query parameters in ``q``. Payloads travel
+    in ``d``. Each stream's handler runs as its own task. Writes go through one lock, so
+    frames from different streams never interleave mid-send.
+    """
+
+    def __init__(self, websocket: WebSocket, codec, services: dict):
+        self.websocket = websocket
+        self.codec = codec
+        self.services = services
+        self.streams = {}
+        self.tasks = {}
+        self.lock = asyncio.Lock()
+
+    async def send(self, frame: dict):
+        await self.write(self.codec.encode(frame))
+
+    async def write(self, data):
+        async with self.lock:
+            if isinstance(data, bytes):
+                await self.websocket.send_bytes(data)
+            else:
+                await self.websocket.send_text(data)
+        mux_bytes_total.inc(len(data), direction="sent", codec=self.codec.subprotocol)
+
+    async def run(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("text")
+                if data is None:
+                    data = message.get("bytes")
+                mux_bytes_total.inc(len(data), direction="received", codec=self.codec.subprotocol)
+                try:
+                    frame = decode_frame(data)
+                except ValueError as e:
+                    await self.send({"t": "error", "error": f"Bad frame: {str(e)}"})
+                    continue
+                await self.handle(frame)
+        finally:
+            for stream in self.streams.values():
+                stream.disconnect()
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    async def handle(self, frame: dict):
+        stream_id = frame.get("s")
+        kind = frame.get("t")
+        stream = self.streams.get(stream_id)
+        if kind == "data":
+            if stream is not None and not stream.closed:
+                stream.inbox.put_nowait(frame.get("j") if "j" in frame else frame.get("d"))
+        elif kind == "open":
+            handler = self.services.get(frame.get("svc"))
+            if not isinstance(stream_id, int) or stream is not None or handler is None:
+                await self.send({"s": stream_id, "t": "close", "code": 1008,
+                                 "reason": f"Cannot open stream for service {frame.get('svc')!r}"})
+                return
+            stream = StreamSocket(self, stream_id, frame["svc"], frame.get("q"))
+            self.streams[stream_id] = stream
+            self.tasks[stream_id] = asyncio.create_task(self._serve(stream, handler))
+            mux_streams_total.inc(service=stream.service)
+        elif kind == "close":
+            if stream is not None:
+                stream.disconnect()
+
+    async def _serve(self, stream: StreamSocket, handler):
+        try:
+            await handler(stream)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.error(f"Error in {stream.service} stream {stream.stream_id}: {str(e)}")
+        finally:
+            self.streams.pop(stream.stream_id, None)
+            self.tasks.pop(stream.stream_id, None)
+            if not stream.closed:
+                # The service finished on its own; tell the client the stream is gone
+                try:
+                    await stream.close()
+                except Exception:
+                    pass
+
+
+class Multiplexer:
+    """Carries every dashboard service over one WebSocket at ``/ws/mux``.
+
+    The client offers ``mux.msgpack`` and/or ``mux.json`` as subprotocols. Binary msgpack
+    framing is chosen when the msgpack package is installed and the client offers it;
+    otherwise frames are compact JSON text. The per-service endpoints stay available for
+    clients that do not multiplex.
+    """
+
+    def __init__(self):
+        self.services = {}
+        self.connections = set()
+
+    def register(self, service: str, handler):
+        """Make ``handler(websocket)`` reachable as ``service`` on the multiplexed socket."""
+        self.services[service] = handler
+
+    def negotiate(self, offered: list):
+        if msgpack is not None and MsgpackCodec.subprotocol in offered:
+            return MsgpackCodec()
+        return JsonCodec()
+
+    async def websocket_endpoint(self, websocket: WebSocket):
+        offered = websocket.scope.get("subprotocols") or []
+        codec = self.negotiate(offered)
+        await websocket.accept(subprotocol=codec.subprotocol if codec.subprotocol in offered else None)
+        connection = MuxConnection(websocket, codec, self.services)
+        self.connections.add(connection)
+        logger.info(f"New multiplexed WebSocket connection ({codec.subprotocol})")
+        try:
+            await connection.run()
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.error(f"Multiplexed WebSocket error: {str(e)}")
+        finally:
+            self.connections.discard(connection)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "streams": sum(len(connection.streams) for connection in self.connections),
+            "services": sorted(self.services),
+            "msgpack": msgpack is not None
+        }
+
+
+multiplexer = Multiplexer()
+
+
+def setup_routes(app: FastAPI):
+    app.websocket("/ws/mux")(multiplexer.websocket_endpoint)
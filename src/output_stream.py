@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+from io import StringIO
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class OutputChannel:
+    """Streams one job's stdout/stderr to a client in coalesced, size/time bounded frames.
+
+    ``write`` only buffers; a sender task batches whatever arrived within
+    ``flush_interval`` into frames of at most ``max_frame_size`` characters. A full
+    frame or ``close`` ends that wait early. Once more than ``high_water`` characters
+    are waiting to be sent, ``write`` blocks until the client catches up. While it
+    blocks, ``WorkerPool.run`` reads no further messages from the worker, so the
+    worker's pipe fills and its next print blocks too. Output past ``max_output`` is
+    dropped and replaced with a single truncation marker.
+    """
+
+    TRUNCATION_MARKER = "\n... [output truncated after {total} characters]\n"
+
+    def __init__(self, send, job_id: str, max_frame_size: int = None, flush_interval: float = None,
+                 high_water: int = None, max_output: int = None):
+        self.send = send
+        self.job_id = job_id
+        self.max_frame_size = max_frame_size or int(os.getenv("EXECUTOR_OUTPUT_FRAME_SIZE", "8192"))
+        self.flush_interval = flush_interval or float(os.getenv("EXECUTOR_OUTPUT_FLUSH_INTERVAL", "0.05"))
+        self.high_water = high_water or int(os.getenv("EXECUTOR_OUTPUT_HIGH_WATER", "65536"))
+        self.max_output = max_output or int(os.getenv("EXECUTOR_MAX_OUTPUT", "1000000"))
+        self.buffer = StringIO()
+        self.total = 0
+        self.truncated = False
+        self.frames_sent = 0
+        self.failed = False
+        self._chunks = []
+        self._pending = 0
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flush = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._sender = asyncio.ensure_future(self._send_loop()) if send else None
+
+    async def write(self, stream: str, text: str):
+        if self.truncated or not text:
+            return
+        if self.total + len(text) > self.max_output:
+            text = text[:self.max_output - self.total]
+            self._append(stream, text)
+            await self.mark_truncated(self.total)
+            return
+        self._append(stream, text)
+        while self._sender and self._pending > self.high_water and not self.failed:
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def mark_truncated(self, total: int):
+        """Stop accepting output and append the truncation marker."""
+        if self.truncated:
+            return
+        self._append("stderr", self.TRUNCATION_MARKER.format(total=total))
+        self.truncated = True
+
+    def _append(self, stream: str, text: str):
+        if not text:
+            return
+        self.buffer.write(text)
+        self.total += len(text)
+        if self._sender is None or self.failed:
+            return
+        self._chunks.append((stream, text))
+        self._pending += len(text)
+        if self._pending >= self.max_frame_size:
+            self._flush.set()
+        self._wakeup.set()
+
+    def _take_frames(self) -> list:
+        frames = []
+        for stream, text in self._chunks:
+            if frames and frames[-1]["stream"] == stream \
+                    and len(frames[-1]["content"]) + len(text) <= self.max_frame_size:
+                frames[-1]["content"] += text
+                continue
+            for start in range(0, len(text), self.max_frame_size):
+                frames.append({
+                    "type": "execution_output",
+                    "job_id": self.job_id,
+                    "stream": stream,
+                    "content": text[start:start + self.max_frame_size]
+                })
+        self._chunks = []
+        self._pending = 0
+        return frames
+
+    async def _send_loop(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._flush.is_set():
+                # Give the job a moment to produce more output for this frame
+                try:
+                    await asyncio.wait_for(self._flush.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if not self._closing:
+                self._flush.clear()
+            try:
+                for frame in self._take_frames():
+                    await self.send(frame)
+                    self.frames_sent += 1
+            except Exception as e:
+                logger.error(f"Error streaming output for job {self.job_id}: {str(e)}")
+                self.failed = True
+                self._chunks = []
+                self._pending = 0
+            self._drained.set()
+            if self._closing and not self._chunks:
+                return
+
+    async def close(self):
+        """Send everything still buffered and stop the sender task."""
+        if self._sender is None:
+            return
+        self._closing = True
+        self._flush.set()
+        self._wakeup.set()
+        await self._sender
+
+    def cancel(self):
+        if self._sender is not None:
+            self._sender.cancel()
+
+    def getvalue(self) -> str:
+        return self.buffer.getvalue()
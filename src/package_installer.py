@@ -0,0 +1,168 @@
+import asyncio
+import importlib
+import logging
+import os
+import re
+import sys
+import time
+from llm_scheduler import SingleFlight
+from metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+installs_total = metrics.counter("package_installs_total", "Package installs by outcome")
+metrics.histogram("package_install_seconds", "Time to install one package")
+
+VALID_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+# Import names whose distribution is called something else
+DISTRIBUTIONS = {
+    "PIL": "Pillow",
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "sklearn": "scikit-learn",
+    "yaml": "PyYAML",
+}
+
+
+def normalize(name: str) -> str:
+    """PEP 503 normalized project name, which is also how wheel filenames are compared."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class PackageInstaller:
+    """Installs missing packages into one directory shared by the server and every worker.
+
+    Packages are installed with ``pip --no-index --find-links <wheelhouse> --target
+    <packages_dir>``, so installs work offline from a local wheel cache. With
+    ``EXECUTOR_PIP_ONLINE=true`` a package that is not in the wheelhouse is first
+    downloaded into it, so each package comes from the network at most once.
+    ``prepare`` creates ``packages_dir`` and puts it on ``sys.path``. The dashboard
+    calls it at startup, before the worker pool starts, and both forkserver and spawn
+    hand the parent's ``sys.path`` to their children, so workers import what was
+    installed without a restart. The first install calls it too. Concurrent
+    requests for the same package share one install, and pip runs one at a time because
+    they all write to the same directory.
+    """
+
+    def __init__(self, packages_dir: str = None, wheelhouse: str = None):
+        self.packages_dir = os.path.abspath(
+            packages_dir or os.getenv("EXECUTOR_PACKAGES_DIR", os.path.join("cache", "site-packages")))
+        self.wheelhouse = os.path.abspath(wheelhouse or os.getenv("EXECUTOR_WHEELHOUSE", os.path.join("cache", "wheels")))
+        self.online = os.getenv("EXECUTOR_PIP_ONLINE", "false").lower() in ("1", "true", "yes")
+        self.auto_install = os.getenv("EXECUTOR_AUTO_INSTALL", "true").lower() not in ("0", "false", "no")
+        self.timeout = float(os.getenv("EXECUTOR_INSTALL_TIMEOUT", "300"))
+        self.flights = SingleFlight()
+        self.version = 0
+        self.installed = []
+        self.failed = 0
+        self._pip_lock = None
+        self._wheels = None
+        self._wheels_mtime = None
+        self._prepared = False
+
+    def prepare(self):
+        """Create ``packages_dir`` and add it to ``sys.path``; workers started afterwards inherit it."""
+        if self._prepared:
+            return
+        os.makedirs(self.packages_dir, exist_ok=True)
+        if self.packages_dir not in sys.path:
+            sys.path.append(self.packages_dir)
+        self._prepared = True
+
+    def distribution(self, module: str) -> str:
+        return DISTRIBUTIONS.get(module, module)
+
+    def wheelhouse_projects(self) -> set:
+        """Normalized names of the projects with a wheel or sdist in the wheelhouse."""
+        try:
+            mtime = os.stat(self.wheelhouse).st_mtime
+        except OSError:
+            return set()
+        if mtime != self._wheels_mtime:
+            projects = set()
+            for filename in os.listdir(self.wheelhouse):
+                if filename.endswith(".whl"):
+                    projects.add(normalize(filename.split("-", 1)[0]))
+                elif filename.endswith((".tar.gz", ".zip")):
+                    projects.add(normalize(filename.rsplit("-", 1)[0]))
+            self._wheels, self._wheels_mtime = projects, mtime
+        return self._wheels
+
+    def available(self, module: str) -> bool:
+        """Whether ``module`` can be installed without touching the network."""
+        return normalize(self.distribution(module)) in self.wheelhouse_projects()
+
+    async def install(self, module: str, on_output=None) -> dict:
+        """Install the package providing ``module``, joining an install already in progress.
+
+        ``on_output(line)`` receives pip's output, including lines printed before this
+        caller joined.
+        """
+        package = self.distribution(module)
+        if not VALID_NAME.match(package):
+            return {"package": package, "success": False, "error": f"Invalid package name: {package!r}"}
+        return await self.flights.run(normalize(package), lambda emit: self._install(package, emit), on_output)
+
+    async def _install(self, package: str, emit) -> dict:
+        self.prepare()
+        if self._pip_lock is None:
+            self._pip_lock = asyncio.Lock()
+        async with self._pip_lock:
+            start = time.perf_counter()
+            try:
+                with metrics.time("package_install_seconds"):
+                    if self.online and normalize(package) not in self.wheelhouse_projects():
+                        os.makedirs(self.wheelhouse, exist_ok=True)
+                        await self._pip(emit, "download", "--dest", self.wheelhouse, package)
+                    await self._pip(emit, "install", "--no-index", "--find-links", self.wheelhouse,
+                                    "--target", self.packages_dir, "--upgrade", package)
+            except Exception as e:
+                self.failed += 1
+                installs_total.inc(outcome="failed")
+                logger.error(f"Installing {package} failed: {str(e)}")
+                return {"package": package, "success": False, "error": str(e)}
+        # Let this process (and, through packages_version, the workers) see the new files
+        importlib.invalidate_caches()
+        self.version += 1
+        self.installed.append(package)
+        installs_total.inc(outcome="installed")
+        logger.info(f"Installed {package} into {self.packages_dir}")
+        return {"package": package, "success": True, "install_time": f"{time.perf_counter() - start:.3f}s"}
+
+    async def _pip(self, emit, *args):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "pip", *args, "--disable-pip-version-check", "--no-input",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        try:
+            returncode = await asyncio.wait_for(self._relay(process, emit), self.timeout)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        if returncode != 0:
+            raise RuntimeError(f"pip {args[0]} exited with status {returncode}")
+
+    @staticmethod
+    async def _relay(process, emit) -> int:
+        async for line in process.stdout:
+            await emit(line.decode("utf-8", "replace"))
+        return await process.wait()
+
+    def stats(self) -> dict:
+        return {
+            "packages_dir": self.packages_dir,
+            "wheelhouse": self.wheelhouse,
+            "online": self.online,
+            "wheelhouse_projects": len(self.wheelhouse_projects()),
+            "installed": list(self.installed),
+            "failed": self.failed,
+            "version": self.version,
+            "flights": self.flights.stats()
+        }
+
+
+package_installer = PackageInstaller()
@@ -0,0 +1,85 @@
+"""Import-time profile and cold-start budget check for the dashboard.
+
+    python src/profile_startup.py [--top 15] [--budget-ms 750]
+
+Imports ``dashboard`` in a fresh interpreter under ``-X importtime``, prints the slowest
+imports by cumulative time, then times the app's lifespan startup. Exits non-zero if
+import plus startup exceeds the budget (``STARTUP_BUDGET_MS``) or if a lazily-loaded
+SDK was imported at module import time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+LAZY_MODULES = ("anthropic", "github", "watchdog")
+
+CHILD = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import dashboard
+imported = time.perf_counter()
+eager = sorted(name for name in {lazy!r} if name in sys.modules)
+
+async def startup():
+    async with dashboard.app.router.lifespan_context(dashboard.app):
+        return time.perf_counter()
+
+started = asyncio.run(startup())
+print(json.dumps({{"import_ms": (imported - start) * 1000, "startup_ms": (started - imported) * 1000,
+                  "eager": eager}}))
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """(cumulative_us, self_us, module) for each top-level import in ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented under the import that triggered them
+        if name[1:].startswith("  "):
+            continue
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "750")))
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.path.join(root, "src"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(lazy=LAZY_MODULES)],
+        cwd=root, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        return result.returncode
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in parse_importtime(result.stderr)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    total = timings["import_ms"] + timings["startup_ms"]
+    print(f"\nimport dashboard: {timings['import_ms']:.1f} ms")
+    print(f"lifespan startup: {timings['startup_ms']:.1f} ms")
+    print(f"cold start:       {total:.1f} ms (budget {args.budget_ms:g} ms)")
+
+    failed = False
+    if timings["eager"]:
+        print(f"FAIL: imported at module load instead of first use: {', '.join(timings['eager'])}")
+        failed = True
+    if total > args.budget_ms:
+        print("FAIL: cold start is over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE = re.compile(r"^(text/|application/(javascript|json|xml)|image/svg)")
+STATIC_REFERENCE = re.compile(r"""(?<=["'(])/static/([^"'()?#\s]+)""")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class StaticAsset:
+    """One file held in memory with its precompressed variants and strong ETag."""
+
+    def __init__(self, name: str, data: bytes, min_compress_bytes: int):
+        self.name = name
+        self.data = data
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        digest = hashlib.sha256(data).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+        stem, extension = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{digest[:10]}{extension}"
+        self.encodings = {}
+        if len(data) >= min_compress_bytes and COMPRESSIBLE.match(self.content_type):
+            variants = {"gzip": gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+            self.encodings = {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+    def etag_for(self, encoding: str = None) -> str:
+        # Each representation gets its own strong validator
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or any(self.etag_for(encoding) in tags for encoding in (None, *self.encodings))
+
+
+class StaticAssets:
+    """In-memory static file server for the dashboard.
+
+    Every file under ``directory`` is read once, precompressed with gzip (and brotli when
+    the ``brotli`` package is installed) and given a content-hashed alias such as
+    ``dashboard.1a2b3c4d5e.js``. References to ``/static/<name>`` inside HTML and CSS are
+    rewritten to the hashed URLs, which are served as immutable; the plain names are
+    served with ``no-cache`` so browsers revalidate them with the ETag. Conditional
+    requests are answered from memory.
+    """
+
+    def __init__(self, directory: str = None, min_compress_bytes: int = None):
+        self.directory = directory or os.getenv("STATIC_DIR", "static")
+        self.min_compress_bytes = min_compress_bytes or int(os.getenv("STATIC_COMPRESS_MIN_BYTES", "512"))
+        self.lock = threading.Lock()
+        self.assets = {}
+        self.hashed = {}
+        self.loaded = False
+
+    def load(self):
+        """(Re)read and compress everything under the static directory."""
+        files = {}
+        for root, _, names in os.walk(self.directory):
+            for filename in names:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    files[name] = f.read()
+        self._build(files)
+        logger.info(f"Loaded {len(files)} static assets"
+                    f"{'' if brotli is not None else ' (brotli not installed; gzip only)'}")
+
+    def refresh(self, paths):
+        """Reload after the watcher reports changes; returns True if any were static files."""
+        directory = os.path.abspath(self.directory)
+        if not any(os.path.abspath(path).startswith(directory + os.sep) for path in paths):
+            return False
+        # References between assets mean one change can move several hashed URLs
+        self.load()
+        return True
+
+    def _build(self, files: dict):
+        def rewrite(match):
+            asset = assets.get(match.group(1))
+            return f"/static/{asset.hashed_name}" if asset is not None else match.group(0)
+
+        assets = {}
+        # Assets that reference others are built after the ones they reference
+        order = sorted(files, key=lambda name: {".css": 1, ".html": 2}.get(os.path.splitext(name)[1], 0))
+        for name in order:
+            data = files[name]
+            if name.endswith((".html", ".css")):
+                data = STATIC_REFERENCE.sub(rewrite, data.decode("utf-8")).encode("utf-8")
+            assets[name] = StaticAsset(name, data, self.min_compress_bytes)
+        with self.lock:
+            self.assets = assets
+            self.hashed = {asset.hashed_name: asset for asset in assets.values()}
+            self.loaded = True
+
+    def get(self, name: str):
+        if not self.loaded:
+            self.load()
+        with self.lock:
+            asset = self.hashed.get(name)
+            if asset is not None:
+                return asset, True
+            return self.assets.get(name), False
+
+    def url_for(self, name: str) -> str:
+        asset, _ = self.get(name)
+        return f"/static/{asset.hashed_name if asset is not None else name}"
+
+    @staticmethod
+    def _accepted(accept_encoding: str) -> set:
+        accepted = set()
+        for part in accept_encoding.split(","):
+            coding, _, params = part.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(coding.strip().lower())
+        return accepted
+
+    def response(self, request: Request, name: str) -> Response:
+        asset, immutable = self.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        headers = {"Cache-Control": IMMUTABLE if immutable else "no-cache", "Vary": "Accept-Encoding"}
+
+        encoding = None
+        accepted = self._accepted(request.headers.get("accept-encoding", ""))
+        for candidate in ("br", "gzip"):
+            if candidate in asset.encodings and (candidate in accepted or "*" in accepted):
+                encoding = candidate
+                break
+        headers["ETag"] = asset.etag_for(encoding)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and asset.matches(if_none_match):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+            return Response(asset.encodings[encoding], media_type=asset.content_type, headers=headers)
+        return Response(asset.data, media_type=asset.content_type, headers=headers)
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,682 @@
+import asyncio
+import builtins
+import importlib
+import itertools
+import logging
+import marshal
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CPUTimeExceeded(BaseException):
+    """Raised inside a worker when a job uses up its CPU-time budget.
+
+    Derives from BaseException so user code's ``except Exception`` cannot swallow it.
+    """
+
+
+class ExecutionLimits:
+    """Per-job resource budget; a value of 0 disables that limit.
+
+    The environment defaults are also the maxima: a request may only tighten them.
+    """
+
+    def __init__(self, wall_time: float = None, cpu_time: float = None, memory_mb: float = None):
+        self.wall_time = float(os.getenv("EXECUTOR_WALL_TIME", "30")) if wall_time is None else wall_time
+        self.cpu_time = float(os.getenv("EXECUTOR_CPU_TIME", "10")) if cpu_time is None else cpu_time
+        self.memory_mb = float(os.getenv("EXECUTOR_MEMORY_MB", "512")) if memory_mb is None else memory_mb
+
+    @classmethod
+    def from_request(cls, requested: dict = None) -> "ExecutionLimits":
+        limits = cls()
+        for name, value in (requested or {}).items():
+            if name not in ("wall_time", "cpu_time", "memory_mb"):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            current = getattr(limits, name)
+            if value > 0 and (not current or value < current):
+                setattr(limits, name, value)
+        return limits
+
+    def to_dict(self) -> dict:
+        return {"wall_time": self.wall_time, "cpu_time": self.cpu_time, "memory_mb": self.memory_mb}
+
+
+def _job_error(error_type: str, message: str) -> dict:
+    return {
+        "status": "error",
+        "error_type": error_type,
+        "error": message,
+        "traceback": ""
+    }
+
+
+class OutputPipe:
+    """Coalesces a worker's stdout/stderr writes into size/time bounded pipe messages.
+
+    Writes are buffered until ``max_chunk`` characters accumulate, the stream changes,
+    or the flusher thread fires every ``flush_interval`` seconds. Output beyond the
+    job's ``max_output`` is dropped and reported once with a "truncated" message.
+    """
+
+    def __init__(self, conn, max_chunk: int = None, flush_interval: float = None):
+        self.conn = conn
+        self.max_chunk = max_chunk or int(os.getenv("EXECUTOR_OUTPUT_CHUNK_SIZE", "4096"))
+        self.flush_interval = flush_interval or float(os.getenv("EXECUTOR_OUTPUT_FLUSH_INTERVAL", "0.05"))
+        self.lock = threading.Lock()
+        self.max_output = 0
+        self.total = 0
+        self.truncated = False
+        self._stream = None
+        self._parts = []
+        self._size = 0
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def begin(self, max_output: int):
+        with self.lock:
+            self.max_output = max_output
+            self.total = 0
+            self.truncated = False
+
+    def write(self, stream: str, text: str):
+        with self.lock:
+            if self.truncated or not text:
+                return
+            if self.max_output and self.total + len(text) > self.max_output:
+                text = text[:self.max_output - self.total]
+                self.truncated = True
+            if stream != self._stream:
+                self._flush_locked()
+                self._stream = stream
+            self._parts.append(text)
+            self._size += len(text)
+            self.total += len(text)
+            if self._size >= self.max_chunk:
+                self._flush_locked()
+            if self.truncated:
+                self._flush_locked()
+                self.conn.send(("truncated", self.total))
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def send(self, message):
+        """Send a control message after any output buffered ahead of it."""
+        with self.lock:
+            self._flush_locked()
+            self.conn.send(message)
+
+    def _flush_locked(self):
+        if self._parts:
+            self.conn.send(("output", self._stream, ''.join(self._parts)))
+            self._parts = []
+            self._size = 0
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except (BrokenPipeError, OSError):
+                return
+
+
+class PipeWriter:
+    """File-like object that forwards writes from a worker to the parent process."""
+
+    def __init__(self, pipe: OutputPipe, stream: str):
+        self.pipe = pipe
+        self.stream = stream
+
+    def write(self, text):
+        self.pipe.write(self.stream, str(text))
+        return len(text)
+
+    def flush(self):
+        self.pipe.flush()
+
+    def isatty(self):
+        return False
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+
+def _pipe_input(conn, pipe: OutputPipe):
+    """Build an input() replacement that asks the parent for a line of input."""
+    def _input(prompt=''):
+        pipe.send(("input_request", str(prompt)))
+        kind, value = conn.recv()
+        return value
+    return _input
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPUTimeExceeded("CPU time limit exceeded")
+
+
+def _set_cpu_limit(seconds: float):
+    """Cap this worker's CPU time at its current usage plus ``seconds`` (0 lifts the cap)."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+# Namespaces that persist across jobs, keyed by the session that owns them
+_namespaces = {}
+
+# PackageInstaller.version as of this worker's last job
+_packages_version = 0
+
+
+def _refresh_packages(payload: dict):
+    global _packages_version
+    if payload.get("packages_version", 0) != _packages_version:
+        # Packages were installed since the last job; drop stale import finder caches
+        importlib.invalidate_caches()
+        _packages_version = payload["packages_version"]
+
+
+def _run_job(conn, pipe: OutputPipe, payload: dict) -> dict:
+    """Execute a single job inside the worker and describe the outcome."""
+    key = payload.get("namespace")
+    namespace = _namespaces.get(key) if key else None
+    if namespace is None:
+        namespace = {"__name__": "__main__", "__builtins__": builtins}
+        if key:
+            _namespaces[key] = namespace
+    namespace["input"] = _pipe_input(conn, pipe)
+    pipe.begin(payload.get("max_output", 0))
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout = PipeWriter(pipe, "stdout")
+    sys.stderr = PipeWriter(pipe, "stderr")
+    _set_cpu_limit(payload.get("cpu_time", 0))
+    try:
+        if "code" in payload:
+            code = marshal.loads(payload["code"])
+        else:
+            code = compile(payload["source"], "<string>", payload["mode"])
+        if payload["mode"] == "eval":
+            result = eval(code, namespace)
+            if result is not None:
+                print(result)
+        else:
+            exec(code, namespace)
+        return {
+            "status": "success",
+            "variables": {
+                k: str(v)
+                for k, v in namespace.items()
+                if not k.startswith('_') and k != "input"
+            }
+        }
+    except CPUTimeExceeded:
+        return _job_error(
+            "CPUTimeLimitExceeded",
+            f"Execution exceeded its CPU time limit of {payload.get('cpu_time'):g}s")
+    except (Exception, SystemExit) as e:
+        return {
+            "status": "error",
+            "error_type": type(e).__name__,
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }
+    finally:
+        _set_cpu_limit(0)
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+
+
+def _preload(modules) -> list:
+    """Import ``modules`` into this process, skipping any that are missing or broken."""
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception as e:
+            logger.debug(f"Not preloading {name}: {str(e)}")
+    return loaded
+
+
+# Exit status of a forked job process that read "stop" (or lost the pipe) instead of a job
+_STOPPED = 3
+
+
+def _serve(conn, pipe: OutputPipe = None, once: bool = False) -> bool:
+    """Run jobs from ``conn`` until told to stop (False), or after one job with ``once`` (True)."""
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return False
+        if message[0] == "stop":
+            return False
+        if message[0] == "run":
+            payload = message[1]
+            _refresh_packages(payload)
+            if pipe is None:
+                pipe = OutputPipe(conn)
+            if once:
+                # Memory polling measures this process rather than the worker
+                pipe.send(("started", os.getpid()))
+            pipe.send(("done", _run_job(conn, pipe, payload)))
+            if once:
+                return True
+
+
+def _serve_forked(conn):
+    """Run every job in its own child of this warmed process, so nothing a job changes outlives it.
+
+    The next child is forked as soon as the previous one exits and then waits for the job
+    itself, which keeps the fork off the job's critical path. This process only reports a
+    child that died without sending its result.
+    """
+    while True:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                status = 0 if _serve(conn, once=True) else _STOPPED
+            finally:
+                # Skip interpreter teardown: atexit hooks and threads belong to the user's code
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        code = os.waitstatus_to_exitcode(status)
+        if code == _STOPPED:
+            return
+        if code != 0:
+            conn.send(("done", _job_error(
+                "WorkerCrashed", f"Execution process exited unexpectedly (exit code {code})")))
+
+
+def _worker_main(conn, preload=(), fork_jobs: bool = False):
+    """Entry point of a pool worker: warm up, announce readiness, then serve jobs forever.
+
+    With ``fork_jobs`` each job runs in a fresh fork of the worker; otherwise jobs share
+    the worker's interpreter, which is what keeps a leased session's namespace alive.
+    """
+    if hasattr(os, "setsid"):
+        # Lead a process group, so killing the worker also kills a job forked from it
+        os.setsid()
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    # Under forkserver these are already in sys.modules (inherited copy-on-write), so this
+    # only costs anything with the spawn start method
+    loaded = _preload(preload)
+    conn.send(("ready", os.getpid(), loaded))
+    if fork_jobs and hasattr(os, "fork"):
+        _serve_forked(conn)
+    else:
+        _serve(conn)
+
+
+# Held while sys.modules["__main__"] is swapped for a worker's start
+_main_lock = threading.Lock()
+
+
+def _start_process(process):
+    """Start ``process`` with executor_worker as the ``__main__`` it re-runs."""
+    with _main_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = importlib.import_module("executor_worker")
+        try:
+            process.start()
+        finally:
+            sys.modules["__main__"] = main
+
+
+class WorkerProcess:
+    """Parent-side handle for one pre-forked worker process."""
+
+    def __init__(self, ctx, worker_id: int, preload=(), fork_jobs: bool = False):
+        self.worker_id = worker_id
+        self.conn, child_conn = ctx.Pipe(duplex=True)
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, tuple(preload), fork_jobs),
+            name=f"executor-worker-{worker_id}",
+            daemon=True
+        )
+        _start_process(self.process)
+        child_conn.close()
+        self.jobs_run = 0
+        self.job_pid = None
+        self.preloaded = []
+        self.broken = False
+        self._loop = None
+        self._inbox = None
+        self._high_water = 0
+        self._reading = False
+
+    def attach(self, loop, high_water: int = 64):
+        """Start delivering messages from the worker's pipe into an asyncio queue.
+
+        Reading pauses while ``high_water`` messages are queued, so a job whose output
+        is not being consumed fills its pipe and blocks in the worker instead of
+        growing the queue.
+        """
+        self._loop = loop
+        self._inbox = asyncio.Queue()
+        self._high_water = max(1, high_water)
+        self._resume()
+
+    def _resume(self):
+        if not self._reading and self._loop is not None and not self.conn.closed:
+            self._reading = True
+            self._loop.add_reader(self.conn.fileno(), self._on_readable)
+
+    def _pause(self):
+        if self._reading:
+            self._reading = False
+            self._loop.remove_reader(self.conn.fileno())
+
+    def _on_readable(self):
+        try:
+            while self._inbox.qsize() < self._high_water and self.conn.poll():
+                self._inbox.put_nowait(self.conn.recv())
+        except (EOFError, OSError):
+            self._pause()
+            self._inbox.put_nowait(("exit", self.process.exitcode))
+            return
+        if self._inbox.qsize() >= self._high_water:
+            self._pause()
+
+    async def recv(self):
+        message = await self._inbox.get()
+        if self._inbox.qsize() <= self._high_water // 2 and message[0] != "exit":
+            self._resume()
+        return message
+
+    def send(self, message):
+        self.conn.send(message)
+
+    @property
+    def alive(self) -> bool:
+        return not self.broken and self.process.is_alive()
+
+    def kill(self):
+        """Stop the current job immediately; the pool replaces the worker on release."""
+        self.broken = True
+        if self.process.is_alive():
+            self._kill_group()
+            self.process.kill()
+
+    def _kill_group(self):
+        # The worker leads its own process group (see _worker_main), which includes a forked job
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def rss_bytes(self):
+        """Resident set size of the worker, or None where /proc is unavailable."""
+        try:
+            with open(f"/proc/{self.job_pid or self.process.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def detach(self):
+        if self._loop is not None and not self.conn.closed:
+            self._pause()
+        self._loop = None
+
+    def close(self, timeout: float = 1.0):
+        """Wait briefly for the process to exit, killing it if it does not."""
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self._kill_group()
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Pool of pre-forked, pre-warmed Python processes that run user code off the event loop.
+
+    Modules named in ``preload`` (``EXECUTOR_PRELOAD``, comma-separated) are imported once
+    in the forkserver, so every worker forked from it, including replacements, starts
+    with them already imported and shares their pages copy-on-write. Missing modules are
+    skipped. Each pooled job then runs in a child forked from its worker, so module
+    changes and threads left behind by one job never reach the next.
+    """
+
+    def __init__(self, size: int = None, start_method: str = None, preload=None):
+        self.size = size or int(os.getenv("EXECUTOR_POOL_SIZE", "0")) or os.cpu_count() or 1
+        if start_method is None:
+            start_method = os.getenv("EXECUTOR_START_METHOD")
+        if start_method is None:
+            methods = multiprocessing.get_all_start_methods()
+            start_method = "forkserver" if "forkserver" in methods else "spawn"
+        self.ctx = multiprocessing.get_context(start_method)
+        if preload is None:
+            preload = os.getenv("EXECUTOR_PRELOAD", "numpy,pandas,pygame").split(",")
+        self.preload = [name.strip() for name in preload if name.strip()]
+        if start_method == "forkserver":
+            # The default preload is __main__, which would be the whole server; workers get
+            # executor_worker as their __main__ instead (see _start_process)
+            self.ctx.set_forkserver_preload([__name__] + self.preload)
+        self.max_jobs_per_worker = int(os.getenv("EXECUTOR_MAX_JOBS_PER_WORKER", "100"))
+        self.memory_poll_interval = float(os.getenv("EXECUTOR_MEMORY_POLL_INTERVAL", "0.1"))
+        self.inbox_high_water = int(os.getenv("EXECUTOR_INBOX_HIGH_WATER", "64"))
+        # Leased workers run outside the pool's rotation, so they get a budget of their own
+        self.max_leases = int(os.getenv("EXECUTOR_MAX_SESSIONS", "0")) or self.size
+        self.leases = 0
+        self.workers = []
+        self._ids = itertools.count(1)
+        self._idle = None
+        self._starting = None
+        self._started = False
+
+    async def start(self):
+        """Fork the workers and wait until each one reports it is ready.
+
+        Every caller waits on one shared startup task, shielded so that a caller being
+        cancelled (say, a job cancelled while the pool warms up) cannot abandon workers
+        half-started.
+        """
+        if self._started:
+            return
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        await asyncio.shield(self._starting)
+
+    async def _start(self):
+        try:
+            idle = asyncio.Queue()
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        except BaseException:
+            # Let the next caller try again; workers that did start are retired by shutdown()
+            self._starting = None
+            raise
+        for worker in workers:
+            idle.put_nowait(worker)
+        self._idle = idle
+        self._started = True
+        logger.info(f"Started {self.size} executor workers ({self.ctx.get_start_method()}); "
+                    f"preloaded: {', '.join(workers[0].preloaded) or 'nothing'}")
+
+    async def _spawn(self, fork_jobs: bool = True) -> WorkerProcess:
+        loop = asyncio.get_running_loop()
+        worker = await loop.run_in_executor(None, WorkerProcess, self.ctx, next(self._ids), self.preload, fork_jobs)
+        worker.attach(loop, self.inbox_high_water)
+        message = await worker.recv()
+        if message[0] != "ready":
+            worker.detach()
+            worker.close()
+            raise RuntimeError(f"Executor worker failed to start: {message!r}")
+        worker.preloaded = message[2]
+        self.workers.append(worker)
+        return worker
+
+    async def acquire(self) -> WorkerProcess:
+        await self.start()
+        return await self._idle.get()
+
+    async def release(self, worker: WorkerProcess):
+        """Return a worker to the pool, replacing it if it died or has served enough jobs."""
+        if worker.alive and worker.jobs_run < self.max_jobs_per_worker:
+            self._idle.put_nowait(worker)
+            return
+        await self._retire(worker)
+        self._idle.put_nowait(await self._spawn())
+
+    async def lease(self) -> WorkerProcess:
+        """Spawn a worker reserved for one owner, outside the shared rotation.
+
+        At most ``max_leases`` (``EXECUTOR_MAX_SESSIONS``, default the pool size) are out
+        at once; beyond that this raises RuntimeError.
+        """
+        if self.leases >= self.max_leases:
+            raise RuntimeError(f"All {self.max_leases} session workers are in use")
+        self.leases += 1
+        try:
+            # The owner's namespace lives in the worker, so its jobs must not be forked
+            return await self._spawn(fork_jobs=False)
+        except BaseException:
+            self.leases -= 1
+            raise
+
+    async def end_lease(self, worker: WorkerProcess):
+        self.leases -= 1
+        await self._retire(worker)
+
+    async def _retire(self, worker: WorkerProcess):
+        if worker in self.workers:
+            self.workers.remove(worker)
+        if worker.alive:
+            try:
+                worker.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        worker.detach()
+        await asyncio.get_running_loop().run_in_executor(None, worker.close)
+
+    async def run(self, payload: dict, on_output=None, on_input=None,
+                  limits: ExecutionLimits = None, on_truncated=None,
+                  worker: WorkerProcess = None) -> dict:
+        """Run a job on an idle worker, streaming output and input requests through callbacks.
+
+        ``payload`` holds either a marshalled ``code`` object or the ``source`` to compile,
+        plus its ``mode`` ("exec" or "eval").
+        ``on_output(stream, text)``, ``on_truncated(total)`` and ``on_input(prompt) -> str``
+        are coroutines. While ``on_output`` is awaited no further messages are read, so
+        the worker's queue and then its pipe fill and the worker blocks on its next write.
+        The job is killed if it exceeds ``limits`` or if the calling task is cancelled.
+        A leased ``worker`` runs the job directly instead of one taken from the pool.
+        """
+        limits = limits or ExecutionLimits()
+        payload = dict(payload, cpu_time=limits.cpu_time)
+        leased = worker is not None
+        if not leased:
+            worker = await self.acquire()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + limits.wall_time if limits.wall_time else None
+        memory_limit = limits.memory_mb * 1024 * 1024 if limits.memory_mb else None
+        finished = False
+        receiver = None
+        try:
+            worker.jobs_run += 1
+            worker.send(("run", payload))
+            while True:
+                timeout = self.memory_poll_interval if memory_limit else None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return _job_error(
+                            "TimeLimitExceeded",
+                            f"Execution exceeded its wall-clock limit of {limits.wall_time:g}s")
+                    timeout = min(timeout, remaining) if timeout else remaining
+                if receiver is None:
+                    receiver = asyncio.ensure_future(worker.recv())
+                done, _ = await asyncio.wait({receiver}, timeout=timeout)
+                if not done:
+                    rss = worker.rss_bytes() if memory_limit else None
+                    if rss is not None and rss > memory_limit:
+                        return _job_error(
+                            "MemoryLimitExceeded",
+                            f"Execution exceeded its memory limit of {limits.memory_mb:g} MB")
+                    continue
+                message = receiver.result()
+                receiver = None
+                kind = message[0]
+                try:
+                    # A client that never answers input() or never reads output must not
+                    # hold the worker past its wall-clock limit
+                    if kind == "output":
+                        if on_output:
+                            await self._before(deadline, on_output(message[1], message[2]))
+                    elif kind == "truncated":
+                        if on_truncated:
+                            await self._before(deadline, on_truncated(message[1]))
+                    elif kind == "input_request":
+                        value = await self._before(deadline, on_input(message[1])) if on_input else ''
+                        worker.send(("input", value))
+                except asyncio.TimeoutError:
+                    return _job_error(
+                        "TimeLimitExceeded",
+                        f"Execution exceeded its wall-clock limit of {limits.wall_time:g}s")
+                if kind == "started":
+                    worker.job_pid = message[1]
+                elif kind == "done":
+                    finished = True
+                    return message[1]
+                elif kind == "exit":
+                    finished = True
+                    return _job_error(
+                        "WorkerCrashed",
+                        f"Execution worker exited unexpectedly (exit code {message[1]})")
+        finally:
+            worker.job_pid = None
+            if receiver is not None:
+                receiver.cancel()
+            if not finished:
+                worker.kill()
+            if not leased:
+                await self.release(worker)
+
+    @staticmethod
+    async def _before(deadline, awaitable):
+        """Await ``awaitable``, raising asyncio.TimeoutError once the loop time passes ``deadline``."""
+        if deadline is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, max(0.0, deadline - asyncio.get_running_loop().time()))
+
+    async def shutdown(self):
+        if self._starting is not None:
+            await asyncio.gather(self._starting, return_exceptions=True)
+        for worker in list(self.workers):
+            await self._retire(worker)
+        self._starting = None
+        self._started = False
+
+
+worker_pool = WorkerPool()
@@ -0,0 +1,384 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+import asyncio
+import bisect
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# mkstemp creates files 0600; new files get the permissions open() would have given them
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class WorkspaceFiles:
+    """The dashboard's view of the files under ``root``.
+
+    Paths are kept in a sorted in-memory index, built by one directory walk on first use
+    and then kept current by the LiveUpdates watcher through ``apply_changes``, so
+    listing never touches the disk. ``matches`` decides which files are indexed and
+    ``ignores`` which directories the walk skips; pass the watcher's filters so the index
+    holds exactly the files it reports on. File bodies are
+    streamed in ``chunk_size`` pieces in both directions and writes are atomic: data goes
+    to a temporary file in the same directory, which then replaces the target.
+
+    Dotfiles and the ``protected`` directories (``WORKSPACE_PROTECTED``, default
+    "config", where the API tokens live) are never listed, read or written, and reads
+    and writes are limited to the files ``matches`` accepts. Downloads only fetch http(s)
+    URLs under ``WORKSPACE_RESOURCE_URL``, and only follow redirects that stay under it.
+    """
+
+    def __init__(self, root: str = None, matches=None, ignores=None, chunk_size: int = None):
+        self.root = os.path.realpath(root or os.getenv("WORKSPACE_ROOT", "."))
+        self.matches = matches or (lambda path: True)
+        self.ignores = ignores or (lambda path: False)
+        self.chunk_size = chunk_size or int(os.getenv("WORKSPACE_CHUNK_SIZE", "65536"))
+        self.save_path = os.getenv("WORKSPACE_SAVE_PATH", "code_examples/dashboard_code.py")
+        self.resource_url = os.getenv("WORKSPACE_RESOURCE_URL", "")
+        self.protected = tuple(name.strip() for name in os.getenv("WORKSPACE_PROTECTED", "config").split(",")
+                               if name.strip())
+        self.lock = threading.Lock()
+        self.paths = None
+        self.index_builds = 0
+
+    def relative(self, path: str):
+        """``path`` (absolute, or relative to the server's cwd) as a workspace path, or None if outside."""
+        path = os.path.relpath(os.path.realpath(path), self.root)
+        if path == os.curdir or path.startswith(os.pardir + os.sep) or path == os.pardir:
+            return None
+        return path.replace(os.sep, "/")
+
+    def resolve(self, name: str) -> str:
+        """The absolute path for workspace path ``name``; raises ValueError if it leaves the root."""
+        path = os.path.realpath(os.path.join(self.root, name.lstrip("/")))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Path is outside the workspace: {name}")
+        return path
+
+    def allowed(self, relative: str) -> bool:
+        """Whether workspace path ``relative`` may be served at all."""
+        parts = relative.split("/")
+        return not any(part.startswith(".") for part in parts) and parts[0] not in self.protected
+
+    def indexable(self, relative: str) -> bool:
+        return self.allowed(relative) and self.matches(relative)
+
+    def accessible(self, name: str, require_match: bool = True) -> str:
+        """Resolve ``name`` for reading or writing; raises PermissionError for hidden,
+        protected or (with ``require_match``) unindexed files."""
+        path = self.resolve(name)
+        relative = self.relative(path)
+        if relative is None or not (self.indexable(relative) if require_match else self.allowed(relative)):
+            raise PermissionError(f"Access denied: {name}")
+        return path
+
+    def _walk(self) -> list:
+        paths = []
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                path = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+                if entry.is_dir(follow_symlinks=False):
+                    # Prune here, so .git, node_modules and the like are never even listed
+                    if self.allowed(path) and not self.ignores(path):
+                        stack.append(entry.path)
+                elif entry.is_file() and self.indexable(path):
+                    paths.append(path)
+        return sorted(paths)
+
+    def build_index(self):
+        paths = self._walk()
+        with self.lock:
+            self.paths = paths
+            self.index_builds += 1
+        logger.info(f"Indexed {len(paths)} workspace files under {self.root}")
+
+    async def listing(self, prefix: str = "", offset: int = 0, limit: int = None) -> list:
+        if self.paths is None:
+            await asyncio.to_thread(self.build_index)
+        with self.lock:
+            start = bisect.bisect_left(self.paths, prefix) if prefix else 0
+            end = bisect.bisect_left(self.paths, prefix + "\uffff") if prefix else len(self.paths)
+            start = min(start + offset, end)
+            return self.paths[start:end if limit is None else min(end, start + limit)]
+
+    def _add(self, path: str):
+        index = bisect.bisect_left(self.paths, path)
+        if index == len(self.paths) or self.paths[index] != path:
+            self.paths.insert(index, path)
+
+    def _discard(self, path: str):
+        index = bisect.bisect_left(self.paths, path)
+        if index < len(self.paths) and self.paths[index] == path:
+            del self.paths[index]
+
+    def apply_changes(self, changes: list):
+        """LiveUpdates listener: fold a batch of file changes into the index."""
+        with self.lock:
+            if self.paths is None:
+                return
+            for change in changes:
+                if "src_path" in change:
+                    src_path = self.relative(change["src_path"])
+                    if src_path is not None:
+                        self._discard(src_path)
+                path = self.relative(change["path"])
+                if path is None:
+                    continue
+                if change["event"] == "deleted":
+                    self._discard(path)
+                elif self.indexable(path):
+                    self._add(path)
+
+    def _byte_range(self, header: str, size: int):
+        """(start, end) inclusive for a single "bytes=" range, None to send the whole file,
+        or False if the range cannot be satisfied."""
+        match = RANGE.match(header.strip())
+        if match is None:
+            # Multiple ranges or another unit: the full body is a valid answer
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def _read_range(self, path: str, start: int, end: int):
+        # A sync generator: Starlette iterates it in a worker thread
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def response(self, request: Request, name: str) -> Response:
+        try:
+            path = self.accessible(name)
+            size = os.stat(path).st_size
+        except PermissionError as e:
+            return JSONResponse({"error": str(e)}, status_code=403)
+        except (ValueError, OSError):
+            return JSONResponse({"error": f"File not found: {name}"}, status_code=404)
+        if not os.path.isfile(path):
+            return JSONResponse({"error": f"Not a file: {name}"}, status_code=404)
+
+        byte_range = self._byte_range(request.headers.get("range", ""), size)
+        if byte_range is False:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is None:
+            # FileResponse streams in chunks, and hands the path to the server to send
+            # directly when it supports the ASGI pathsend extension
+            return FileResponse(path, headers={"Accept-Ranges": "bytes"})
+        start, end = byte_range
+        return StreamingResponse(
+            self._read_range(path, start, end),
+            status_code=206,
+            media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+            headers={
+                "Accept-Ranges": "bytes",
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1)
+            })
+
+    def _open_temp(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+        return os.fdopen(fd, "wb"), temp_path
+
+    def _commit(self, f, temp_path: str, path: str):
+        """Flush the temporary file and move it over ``path`` in one step."""
+        try:
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            if os.path.exists(path):
+                os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+            else:
+                os.chmod(temp_path, 0o666 & ~UMASK)
+            os.replace(temp_path, path)
+        except BaseException:
+            f.close()
+            os.unlink(temp_path)
+            raise
+        self._written(path)
+
+    def _written(self, path: str):
+        # Index it now rather than waiting for the watcher's batch window
+        relative = self.relative(path)
+        with self.lock:
+            if self.paths is not None and relative is not None and self.indexable(relative):
+                self._add(relative)
+
+    def write_text(self, name: str, content: str) -> int:
+        path = self.accessible(name)
+        data = content.encode("utf-8")
+        f, temp_path = self._open_temp(path)
+        try:
+            for start in range(0, len(data), self.chunk_size):
+                f.write(data[start:start + self.chunk_size])
+        except BaseException:
+            f.close()
+            os.unlink(temp_path)
+            raise
+        self._commit(f, temp_path, path)
+        return len(data)
+
+    async def write_stream(self, name: str, chunks) -> int:
+        """Write an async iterable of byte chunks (e.g. a request body) to ``name`` atomically."""
+        path = self.accessible(name)
+        f, temp_path = await asyncio.to_thread(self._open_temp, path)
+        written = 0
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    await asyncio.to_thread(f.write, chunk)
+                    written += len(chunk)
+        except BaseException:
+            f.close()
+            os.unlink(temp_path)
+            raise
+        await asyncio.to_thread(self._commit, f, temp_path, path)
+        return written
+
+    def _base_url(self):
+        if not self.resource_url:
+            raise PermissionError("Downloads are disabled: WORKSPACE_RESOURCE_URL is not set")
+        base = urllib.parse.urlsplit(self.resource_url.rstrip("/") + "/")
+        if base.scheme not in ("http", "https") or not base.netloc:
+            raise PermissionError("WORKSPACE_RESOURCE_URL must be an http(s) URL")
+        return base
+
+    def allowed_url(self, url: str) -> bool:
+        """Whether ``url`` is an http(s) URL under WORKSPACE_RESOURCE_URL."""
+        base = self._base_url()
+        target = urllib.parse.urlsplit(url)
+        # Compare decoded, normalized paths so "%2e%2e/" cannot climb out of the base
+        path = posixpath.normpath(urllib.parse.unquote(target.path) or "/")
+        return (target.scheme == base.scheme and target.netloc == base.netloc
+                and (path + "/").startswith(urllib.parse.unquote(base.path)))
+
+    def download(self, name: str, url: str = None) -> dict:
+        """Fetch ``url`` (default: ``name`` under WORKSPACE_RESOURCE_URL) into the workspace."""
+        url = url or urllib.parse.urljoin(self._base_url().geturl(), urllib.parse.quote(name))
+        if not self.allowed_url(url):
+            raise PermissionError(f"Downloads are limited to URLs under {self.resource_url}")
+        path = self.accessible(name, require_match=False)
+        opener = urllib.request.build_opener(_RedirectGuard(self.allowed_url))
+        f, temp_path = self._open_temp(path)
+        written = 0
+        try:
+            with opener.open(url, timeout=float(os.getenv("WORKSPACE_DOWNLOAD_TIMEOUT", "30"))) as source:
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        except BaseException:
+            f.close()
+            os.unlink(temp_path)
+            raise
+        self._commit(f, temp_path, path)
+        return {"path": self.relative(path), "size": written}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "root": self.root,
+                "indexed": len(self.paths) if self.paths is not None else None,
+                "index_builds": self.index_builds
+            }
+
+
+class _RedirectGuard(urllib.request.HTTPRedirectHandler):
+    """Refuses redirects to URLs that ``allowed`` rejects."""
+
+    def __init__(self, allowed):
+        self.allowed = allowed
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not self.allowed(newurl):
+            raise urllib.error.HTTPError(newurl, code, "Redirect leaves WORKSPACE_RESOURCE_URL", headers, fp)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def error_response(e: Exception) -> JSONResponse:
+    if isinstance(e, PermissionError):
+        status_code = 403
+    elif isinstance(e, FileNotFoundError):
+        status_code = 404
+    else:
+        status_code = 400
+    return JSONResponse({"success": False, "error": str(e)}, status_code=status_code)
+
+
+workspace_files = WorkspaceFiles()
+
+
+def setup_routes(app: FastAPI):
+    @app.get("/api/files")
+    async def list_files(prefix: str = "", offset: int = 0, limit: int = None, refresh: bool = False):
+        if refresh:
+            # Directory moves are not reported file by file, so allow a full rescan
+            await asyncio.to_thread(workspace_files.build_index)
+        return await workspace_files.listing(prefix, offset, limit)
+
+    @app.get("/api/files/{name:path}")
+    async def get_file(name: str, request: Request):
+        return workspace_files.response(request, name)
+
+    @app.put("/api/files/{name:path}")
+    async def put_file(name: str, request: Request):
+        try:
+            size = await workspace_files.write_stream(name, request.stream())
+        except (ValueError, OSError) as e:
+            return error_response(e)
+        return {"success": True, "path": name, "size": size}
+
+    @app.post("/save-code")
+    async def save_code(request: Request):
+        data = await request.json()
+        name = data.get("path") or workspace_files.save_path
+        try:
+            size = await asyncio.to_thread(workspace_files.write_text, name, data.get("code", ""))
+        except (ValueError, OSError) as e:
+            return error_response(e)
+        return {"success": True, "path": name, "size": size}
+
+    @app.post("/download-resource")
+    async def download_resource(request: Request):
+        data = await request.json()
+        try:
+            result = await asyncio.to_thread(workspace_files.download, data.get("resource", ""), data.get("url"))
+        except (ValueError, PermissionError) as e:
+            return error_response(e)
+        except Exception as e:
+            logger.error(f"Error downloading resource {data.get('resource')}: {str(e)}")
+            return {"success": False, "error": str(e)}
+        return dict(result, success=True)
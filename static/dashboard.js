@@ -5,6 +5,7 @@ class Dashboard {
         this.llmSocket = null;
         this.executeSocket = null;
         this.isExecuting = false;
+        this.currentJobId = null;
         this.interactiveMode = false;
         this.resourceCache = new Map();
         this.errorDecorations = [];
@@ -56,9 +57,10 @@ class Dashboard {
     }
 
     initializeWebSockets() {
+        // Both services share one multiplexed connection when the server offers it (see mux.js)
         // LLM WebSocket
-        this.llmSocket = new WebSocket(`ws://${window.location.host}/ws/llm`);
-        this.llmSocket.onmessage = (event) => this.handleLLMMessage(JSON.parse(event.data));
+        this.llmSocket = ServiceSockets.open('llm');
+        this.llmSocket.onmessage = (event) => this.handleLLMMessage(event.payload ?? JSON.parse(event.data));
         this.llmSocket.onopen = () => {
             this.updateStatus('LLM service connected', 'success');
             this.updateConnectionIndicator('llm', true);
@@ -73,8 +75,8 @@ class Dashboard {
         };
 
         // Execute WebSocket
-        this.executeSocket = new WebSocket(`ws://${window.location.host}/ws/execute`);
-        this.executeSocket.onmessage = (event) => this.handleExecuteMessage(JSON.parse(event.data));
+        this.executeSocket = ServiceSockets.open('execute');
+        this.executeSocket.onmessage = (event) => this.handleExecuteMessage(event.payload ?? JSON.parse(event.data));
         this.executeSocket.onopen = () => {
             this.updateStatus('Execute service connected', 'success');
             this.updateConnectionIndicator('execute', true);
@@ -270,6 +272,10 @@ class Dashboard {
                         this.debugCode();
                         break;
                 }
+            } else if (e.key === 'Escape' && this.isExecuting) {
+                this.cancelExecution();
+            } else if (e.key === 'Escape' && this.generationId) {
+                this.cancelGeneration();
             }
         });
     }
@@ -299,9 +305,13 @@ class Dashboard {
 
     generateCode(prompt) {
         if (this.llmSocket && this.llmSocket.readyState === WebSocket.OPEN) {
+            this.generationId = `gen-${Date.now()}`;
+            this.streamingCode = '';
             this.llmSocket.send(JSON.stringify({
                 type: 'generate_code',
-                prompt: prompt
+                request_id: this.generationId,
+                prompt: prompt,
+                stream: true
             }));
             this.updateStatus('Generating code...', 'info');
         } else {
@@ -327,6 +337,25 @@ class Dashboard {
         }
     }
 
+    cancelGeneration() {
+        if (this.generationId && this.llmSocket && this.llmSocket.readyState === WebSocket.OPEN) {
+            this.llmSocket.send(JSON.stringify({
+                type: 'cancel_generation',
+                request_id: this.generationId
+            }));
+        }
+    }
+
+    cancelExecution() {
+        if (this.currentJobId && this.executeSocket && this.executeSocket.readyState === WebSocket.OPEN) {
+            this.executeSocket.send(JSON.stringify({
+                type: 'cancel',
+                job_id: this.currentJobId
+            }));
+            this.updateStatus('Cancelling execution...', 'info');
+        }
+    }
+
     debugCode() {
         const code = this.editor.getValue();
         if (this.executeSocket && this.executeSocket.readyState === WebSocket.OPEN) {
@@ -431,10 +460,28 @@ class Dashboard {
 
     handleLLMMessage(message) {
         switch (message.type) {
+            case 'code_delta':
+                if (message.request_id === this.generationId) {
+                    this.streamingCode += message.delta;
+                    this.editor.setValue(this.streamingCode);
+                }
+                break;
             case 'code_generated':
+                this.generationId = null;
                 this.editor.setValue(message.code);
                 this.updateStatus('Code generated successfully', 'success');
                 break;
+            case 'pipeline_status':
+                if (message.stage === 'executing') {
+                    this.updateStatus('Executing generated code...', 'info');
+                } else if (message.stage === 'failed') {
+                    this.updateStatus(`Generation failed: ${message.error}`, 'error');
+                }
+                break;
+            case 'generation_cancelled':
+                this.generationId = null;
+                this.updateStatus('Code generation cancelled', 'warning');
+                break;
             case 'code_improved':
                 this.editor.setValue(message.code);
                 this.updateStatus('Code improved successfully', 'success');
@@ -442,6 +489,10 @@ class Dashboard {
             case 'interactive_prompt':
                 this.handleInteractivePrompt(message.prompt);
                 break;
+            case 'interactive_input_request':
+                // Generated code running in the pipeline is asking for input()
+                this.handleInteractiveInputRequest(message.content, this.llmSocket, message.job_id);
+                break;
             default:
                 console.log('Unhandled LLM message:', message);
         }
@@ -452,17 +503,52 @@ class Dashboard {
         const debugOutput = document.getElementById('debug-output');
 
         switch (message.type) {
-            case 'execution_result':
+            case 'session_started':
+                this.executionSessionId = message.session_id;
+                break;
+            case 'execution_queued':
+                if (message.position > 1) {
+                    this.updateStatus(`Execution queued (position ${message.position})`, 'info');
+                }
+                break;
+            case 'namespace_reset':
+                this.updateStatus('Execution session namespace was reset', 'warning');
+                break;
+            case 'execution_started':
+                this.currentJobId = message.job_id;
+                this.streamedOutput = false;
+                break;
+            case 'execution_output':
+                this.appendExecutionOutput(message.content, message.stream);
+                break;
+            case 'execution_cancelled':
                 this.isExecuting = false;
+                this.currentJobId = null;
                 this.hideExecutionLoader();
-
-                // Update BOTH output panels
-                executionOutput.innerHTML = `
-                    <pre class="${message.success ? 'success-output' : 'error-output'}">
-                        ${message.output}
-                    </pre>
-                `;
-                this.updateInteractiveOutput(message.output);
+                this.updateStatus('Execution cancelled', 'warning');
+                break;
+            case 'execution_result':
+                this.isExecuting = false;
+                this.currentJobId = null;
+
+                let output = message.output;
+                if (this.streamedOutput) {
+                    // Output already arrived incrementally; just mark the final state
+                    const streamed = executionOutput.querySelector('pre.stream-output');
+                    if (streamed) {
+                        streamed.classList.add(message.success ? 'success-output' : 'error-output');
+                        // A streamed result leaves the output out instead of sending it twice
+                        output = output ?? streamed.textContent;
+                    }
+                } else {
+                    this.hideExecutionLoader();
+                    executionOutput.innerHTML = `
+                        <pre class="${message.success ? 'success-output' : 'error-output'}">
+                            ${output ?? ''}
+                        </pre>
+                    `;
+                }
+                this.updateInteractiveOutput(output ?? '');
 
                 this.updateStatus(message.success ? 'Code executed successfully' : 'Code execution failed',
                     message.success ? 'success' : 'error');
@@ -470,14 +556,51 @@ class Dashboard {
             case 'resource_missing':
                 this.handleResourceMissing(message.resource);
                 break;
+            case 'install_started':
+                this.updateStatus(`Installing ${message.package}...`, 'info');
+                break;
+            case 'install_output':
+                if (debugOutput) {
+                    debugOutput.textContent += message.content;
+                }
+                break;
+            case 'install_result':
+                if (message.success) {
+                    this.updateStatus(`Installed ${message.package}`, 'success');
+                    // Installs requested from the missing-package dialog re-run the code
+                    if (!message.job_id) {
+                        this.executeCode();
+                    }
+                } else {
+                    this.updateStatus(`Failed to install ${message.package}: ${message.error}`, 'error');
+                }
+                break;
             case 'interactive_input_request':
-                this.handleInteractiveInputRequest(message.content);
+                this.handleInteractiveInputRequest(message.content, this.executeSocket, message.job_id);
                 break;
             default:
                 console.log('Unhandled execute message:', message);
         }
     }
 
+    appendExecutionOutput(text, stream = 'stdout') {
+        const executionOutput = document.getElementById('execution-output');
+        if (!executionOutput) return;
+
+        let pre = executionOutput.querySelector('pre.stream-output');
+        if (!this.streamedOutput || !pre) {
+            this.hideExecutionLoader();
+            pre = document.createElement('pre');
+            pre.className = 'stream-output';
+            executionOutput.appendChild(pre);
+            this.streamedOutput = true;
+        }
+        const chunk = document.createElement('span');
+        chunk.className = stream === 'stderr' ? 'stderr-output' : 'stdout-output';
+        chunk.textContent = text;
+        pre.appendChild(chunk);
+    }
+
     updateInteractiveOutput(output) {
         const interactiveOutput = document.getElementById('interactive-output');
         if (interactiveOutput) {
@@ -496,13 +619,14 @@ class Dashboard {
         this.dependencyManager.resolveResourceMissing(resource);
     }
 
-    handleInteractiveInputRequest(prompt) {
+    handleInteractiveInputRequest(prompt, socket = this.executeSocket, jobId = null) {
         this.interactiveInputHandler(prompt)
             .then(input => {
                 // Send the input back to the server
-                this.executeSocket.send(JSON.stringify({
+                socket.send(JSON.stringify({
                     type: 'input', // Use the correct message type for input
-                    value: input
+                    value: input,
+                    job_id: jobId
                 }));
             });
     }
@@ -3,16 +3,32 @@ class GitHubManager {
         this.ws = null;
         this.currentFile = null;
         this.files = [];
+        // Whole-repo index from one recursive tree request, keyed by directory path
+        this.tree = null;
+        this.directories = null;
         this.initializeWebSocket();
     }
 
     initializeWebSocket() {
         this.ws = new WebSocket(`ws://${window.location.host}/ws/github`);
         this.ws.onmessage = (event) => this.handleMessage(JSON.parse(event.data));
-        this.ws.onopen = () => this.loadFiles();
+        this.ws.onopen = () => this.loadTree();
+    }
+
+    async loadTree(branch = null) {
+        if (this.ws.readyState === WebSocket.OPEN) {
+            this.ws.send(JSON.stringify({
+                operation: 'tree',
+                branch: branch
+            }));
+        }
     }
 
     async loadFiles(path = "") {
+        if (this.directories && this.directories.has(path)) {
+            this.updateFileTree(this.directories.get(path));
+            return;
+        }
         if (this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 operation: 'list',
@@ -42,6 +58,18 @@ class GitHubManager {
         }
     }
 
+    async commitFiles(changes, message = "") {
+        if (this.ws.readyState === WebSocket.OPEN) {
+            this.ws.send(JSON.stringify({
+                operation: 'batch_commit',
+                changes: changes,
+                message: message,
+                branch: this.tree ? this.tree.branch : null,
+                base_sha: this.tree ? this.tree.commit_sha : null
+            }));
+        }
+    }
+
     async deleteFile(path, sha, message = "") {
         if (this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
@@ -55,6 +83,12 @@ class GitHubManager {
 
     handleMessage(data) {
         switch (data.type) {
+            case 'tree':
+                this.setTree(data.content);
+                break;
+            case 'batch_commit':
+                this.handleCommitResponse(data.content);
+                break;
             case 'files':
                 this.updateFileTree(data.content);
                 break;
@@ -73,6 +107,25 @@ class GitHubManager {
         }
     }
 
+    setTree(tree) {
+        this.tree = tree;
+        this.directories = null;
+        if (!tree.truncated) {
+            this.directories = new Map([["", []]]);
+            tree.entries.forEach(entry => {
+                if (entry.type === 'directory') {
+                    this.directories.set(entry.path, []);
+                }
+            });
+            tree.entries.forEach(entry => {
+                const slash = entry.path.lastIndexOf('/');
+                const parent = slash === -1 ? "" : entry.path.slice(0, slash);
+                this.directories.get(parent).push(entry);
+            });
+        }
+        this.loadFiles();
+    }
+
     updateFileTree(files) {
         this.files = files;
         const fileTree = document.getElementById('file-tree');
@@ -106,12 +159,21 @@ class GitHubManager {
         if (this.currentFile) {
             this.currentFile.sha = response.sha;
         }
+        this.loadTree(this.tree ? this.tree.branch : null);
         this.showNotification('File saved successfully!', 'success');
     }
 
+    handleCommitResponse(response) {
+        if (this.currentFile && this.currentFile.path in response.files) {
+            this.currentFile.sha = response.files[this.currentFile.path];
+        }
+        this.loadTree(this.tree ? this.tree.branch : null);
+        this.showNotification(`Committed ${Object.keys(response.files).length} file(s)`, 'success');
+    }
+
     handleDeleteResponse(response) {
         if (response.success) {
-            this.loadFiles();
+            this.loadTree(this.tree ? this.tree.branch : null);
             this.showNotification('File deleted successfully!', 'success');
         }
     }
@@ -0,0 +1,170 @@
+// mux.js - carries the dashboard's service sockets over one multiplexed WebSocket
+//
+// ServiceSockets.open('execute') returns an object with the WebSocket interface the
+// dashboard uses (send, readyState, onopen/onmessage/onclose/onerror). Messages arrive
+// with the decoded object in event.payload, so handlers can skip JSON.parse. When
+// /ws/mux is unavailable, every stream falls back to its own /ws/<service> socket.
+// Load @msgpack/msgpack (window.MessagePack) before this file to use binary framing.
+
+class ServiceStream {
+    constructor(mux, id, service, query) {
+        this.mux = mux;
+        this.id = id;
+        this.service = service;
+        this.query = query;
+        this.readyState = WebSocket.CONNECTING;
+        this.pending = [];
+        this.socket = null;
+        this.onopen = null;
+        this.onmessage = null;
+        this.onclose = null;
+        this.onerror = null;
+    }
+
+    send(text) {
+        if (this.socket) {
+            this.socket.send(text);
+        } else if (this.readyState === WebSocket.OPEN) {
+            this.mux.sendData(this.id, text);
+        } else if (this.readyState === WebSocket.CONNECTING) {
+            this.pending.push(text);
+        }
+    }
+
+    close() {
+        if (this.socket) {
+            this.socket.close();
+        } else if (this.readyState !== WebSocket.CLOSED) {
+            this.mux.sendFrame({s: this.id, t: 'close'});
+            this.closed(1000);
+        }
+    }
+
+    opened() {
+        this.readyState = WebSocket.OPEN;
+        this.pending.splice(0).forEach(text => this.send(text));
+        if (this.onopen) this.onopen({type: 'open'});
+    }
+
+    received(payload, text = null) {
+        if (!this.onmessage) return;
+        this.onmessage({type: 'message', payload, get data() { return text ?? JSON.stringify(payload); }});
+    }
+
+    closed(code, reason = '') {
+        if (this.readyState === WebSocket.CLOSED) return;
+        this.readyState = WebSocket.CLOSED;
+        if (this.onclose) this.onclose({type: 'close', code, reason});
+    }
+
+    fallBack() {
+        // The multiplexed endpoint is unavailable; use this service's own socket instead
+        const query = new URLSearchParams(this.query).toString();
+        this.socket = new WebSocket(`ws://${window.location.host}/ws/${this.service}${query ? '?' + query : ''}`);
+        this.socket.onopen = (event) => this.opened(event);
+        this.socket.onmessage = (event) => this.onmessage && this.onmessage(event);
+        this.socket.onclose = (event) => this.closed(event.code, event.reason);
+        this.socket.onerror = (event) => this.onerror && this.onerror(event);
+    }
+}
+
+class MuxSocket {
+    constructor(url) {
+        this.streams = new Map();
+        this.nextId = 1;
+        this.opened = false;
+        this.packer = window.MessagePack || null;
+        this.socket = new WebSocket(url, this.packer ? ['mux.msgpack', 'mux.json'] : ['mux.json']);
+        this.socket.binaryType = 'arraybuffer';
+        this.socket.onopen = () => {
+            this.opened = true;
+            this.binary = this.socket.protocol === 'mux.msgpack';
+            this.streams.forEach(stream => this.sendOpen(stream));
+        };
+        this.socket.onmessage = (event) => this.handleFrame(event.data);
+        this.socket.onclose = (event) => {
+            const streams = [...this.streams.values()];
+            this.streams.clear();
+            if (!this.opened) {
+                streams.forEach(stream => stream.fallBack());
+            } else {
+                streams.forEach(stream => stream.closed(event.code, event.reason));
+            }
+        };
+    }
+
+    open(service, query = {}) {
+        const stream = new ServiceStream(this, this.nextId++, service, query);
+        if (this.socket.readyState === WebSocket.CLOSED) {
+            stream.fallBack();
+            return stream;
+        }
+        this.streams.set(stream.id, stream);
+        if (this.opened) this.sendOpen(stream);
+        return stream;
+    }
+
+    sendOpen(stream) {
+        this.sendFrame({s: stream.id, t: 'open', svc: stream.service, q: stream.query});
+    }
+
+    sendData(id, text) {
+        let payload = text;
+        try {
+            payload = JSON.parse(text);
+        } catch (error) {
+            // Plain text messages (e.g. "stats") are passed through as strings
+        }
+        this.sendFrame({s: id, t: 'data', d: payload});
+    }
+
+    sendFrame(frame) {
+        if (this.socket.readyState !== WebSocket.OPEN) return;
+        this.socket.send(this.binary ? this.packer.encode(frame) : JSON.stringify(frame));
+    }
+
+    handleFrame(data) {
+        const frame = typeof data === 'string' ? JSON.parse(data) : this.packer.decode(new Uint8Array(data));
+        const stream = this.streams.get(frame.s);
+        if (!stream) {
+            if (frame.t === 'error') console.error('Multiplexed socket error:', frame.error);
+            return;
+        }
+        switch (frame.t) {
+            case 'open':
+                stream.opened();
+                break;
+            case 'data':
+                if (frame.j !== undefined) {
+                    stream.received(JSON.parse(frame.j), frame.j);
+                } else {
+                    stream.received(frame.d);
+                }
+                break;
+            case 'close':
+                this.streams.delete(frame.s);
+                stream.closed(frame.code, frame.reason);
+                break;
+        }
+    }
+}
+
+const ServiceSockets = {
+    mux: null,
+
+    // Multiplexing is on unless the page is opened with ?mux=0
+    enabled() {
+        return new URLSearchParams(window.location.search).get('mux') !== '0';
+    },
+
+    open(service, query = {}) {
+        if (!this.enabled()) {
+            const params = new URLSearchParams(query).toString();
+            return new WebSocket(`ws://${window.location.host}/ws/${service}${params ? '?' + params : ''}`);
+        }
+        if (!this.mux) {
+            this.mux = new MuxSocket(`ws://${window.location.host}/ws/mux`);
+        }
+        return this.mux.open(service, query);
+    }
+};
@@ -1,6 +1,10 @@
 class VSCodeWatcher {
     constructor() {
         this.currentFile = null;
+        // The open file's text as the server has it (the editor normalizes line endings),
+        // and its SHA-256, which change diffs name as their base
+        this.currentContent = '';
+        this.currentHash = null;
         this.initializeFileSystem();
     }
 
@@ -32,14 +36,24 @@ class VSCodeWatcher {
     async openFile(filename) {
         try {
             const response = await fetch(`/api/files/${filename}`);
-            const content = await response.text();
+            const data = await response.arrayBuffer();
+            const content = new TextDecoder('utf-8', {ignoreBOM: true}).decode(data);
             this.currentFile = filename;
+            this.currentContent = content;
+            this.currentHash = await this.contentHash(data);
             this.updateEditor(content);
         } catch (error) {
             console.error('Error opening file:', error);
         }
     }
 
+    async contentHash(data) {
+        // crypto.subtle only exists in secure contexts; without it every change reloads the file
+        if (!window.crypto || !crypto.subtle) return null;
+        const digest = await crypto.subtle.digest('SHA-256', data);
+        return [...new Uint8Array(digest)].map(byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
     updateEditor(content) {
         const editor = document.getElementById('editor');
         if (editor) {
@@ -47,14 +61,35 @@ class VSCodeWatcher {
         }
     }
 
+    applyChange(change) {
+        const editor = document.getElementById('editor');
+        if (editor && change.content !== undefined) {
+            this.currentContent = change.content;
+        } else if (editor && change.diff && change.base_hash && change.base_hash === this.currentHash) {
+            // Lines end at "\n" only, exactly as the server splits them
+            const lines = this.currentContent.split(/(?<=\n)/);
+            // Ops index into the old lines, so apply them back to front
+            for (const [start, end, replacement] of [...change.diff].reverse()) {
+                lines.splice(start, end - start, ...replacement);
+            }
+            this.currentContent = lines.join('');
+        } else {
+            this.openFile(this.currentFile);
+            return;
+        }
+        this.currentHash = change.hash || null;
+        this.updateEditor(this.currentContent);
+    }
+
     setupFileWatcher() {
         const ws = new WebSocket(`ws://${window.location.host}/ws/updates`);
         ws.onmessage = (event) => {
             const data = JSON.parse(event.data);
-            if (data.type === 'file_changed') {
+            if (data.type === 'files_changed') {
                 this.refreshFileList();
-                if (data.path === this.currentFile) {
-                    this.openFile(this.currentFile);
+                const change = data.changes.find(change => change.path === this.currentFile && change.event !== 'deleted');
+                if (change) {
+                    this.applyChange(change);
                 }
             }
         };
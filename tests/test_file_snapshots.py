@@ -0,0 +1,57 @@
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from file_snapshots import SnapshotStore
+
+
+def apply_like_client(content: str, diff: list) -> str:
+    """What static/vscode.js does with a diff: split after "\n" only, apply ops back to front."""
+    lines = [line for line in re.split(r"(?<=\n)", content) if line]
+    for start, end, replacement in reversed(diff):
+        lines[start:end] = replacement
+    return "".join(lines)
+
+
+def write(path, text: str):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def test_diff_indices_match_client_lines_with_other_separators(tmp_path):
+    path = str(tmp_path / "page.py")
+    base = "".join(f"line {i}\r\n" if i % 3 else f"line {i}\fpage\rcr\x85nel ls\n" for i in range(40))
+    write(path, base)
+    store = SnapshotStore()
+    store.seed(path)
+
+    changed = base.replace("line 10\r\n", "line ten\r\n").replace("line 33\r\n", "")
+    write(path, changed)
+    change = store.annotate({"event": "modified", "path": path})
+
+    assert "diff" in change
+    assert apply_like_client(base, change["diff"]) == changed
+
+
+def test_touch_after_seed_is_not_reported(tmp_path):
+    path = str(tmp_path / "app.js")
+    write(path, "let a = 1;\nlet b = 2;\n")
+    store = SnapshotStore()
+    store.seed(path)
+
+    assert store.annotate({"event": "modified", "path": path}) is None
+
+
+def test_seed_keeps_a_change_recorded_first(tmp_path):
+    path = str(tmp_path / "app.js")
+    write(path, "old\n")
+    store = SnapshotStore()
+    store.seed(path)
+    write(path, "new\n")
+    change = store.annotate({"event": "modified", "path": path})
+    write(path, "newer\n")
+    store.seed(path)
+
+    assert store.hashes[path] == change["hash"]